@@ -10,3 +10,9 @@ class TokenAuth(requests.auth.AuthBase):
   def __call__(self, request: requests.Request) -> requests.Request:
     request.headers['Authorization'] = f'Apikey {self.api_key}'
     return request
+
+  def __eq__(self, other: object) -> bool:
+    return isinstance(other, TokenAuth) and self.api_key == other.api_key
+
+  def __hash__(self) -> int:
+    return hash((TokenAuth, self.api_key))
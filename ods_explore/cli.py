@@ -0,0 +1,113 @@
+import argparse
+import logging
+import os
+import sys
+from typing import List
+
+from . import extract
+from .opendatasoft import Opendatasoft
+
+
+def parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(
+    prog='ods-explore',
+    description="Command-line interface for Opendatasoft's Explore API"
+  )
+  parser.add_argument(
+    '-v', '--verbose', action='store_true', help='Log every API call'
+  )
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  extract_parser = subparsers.add_parser(
+    'extract',
+    help='Extract dataset records to a file, resuming interrupted extractions'
+  )
+  domain = extract_parser.add_mutually_exclusive_group()
+  domain.add_argument(
+    '--subdomain', default='data',
+    help='Subdomain of the base API URL, eg. https://{subdomain}.opendatasoft.com'
+  )
+  domain.add_argument('--base-url', help='Custom base API URL')
+  extract_parser.add_argument(
+    '--api-key', default=os.environ.get('ODS_API_KEY'),
+    help='API key for private datasets. Default: $ODS_API_KEY'
+  )
+  extract_parser.add_argument('--dataset', required=True, help='Dataset id')
+  extract_parser.add_argument(
+    '--where', action='append', default=[],
+    help='ODSQL filter. Can be repeated'
+  )
+  extract_parser.add_argument(
+    '--select', action='append', default=[],
+    help='Field or expression to return. Can be repeated'
+  )
+  extract_parser.add_argument(
+    '--order-by', action='append', default=[],
+    help='Field to order by, prefixed with `-` for descending order. Can be '
+      'repeated'
+  )
+  extract_parser.add_argument(
+    '--key',
+    help='Unique field to page through records by, for extractions of more '
+      'than 10000 records. Records are then ordered by it'
+  )
+  extract_parser.add_argument('--out', required=True, help='Output file path')
+  extract_parser.add_argument(
+    '--format', choices=extract.FORMATS, default=None,
+    help='Output format. Default: guessed from the output file extension, or '
+      'jsonl'
+  )
+  extract_parser.add_argument(
+    '--batch-size', type=int, default=100,
+    help='Number of records to fetch per API call'
+  )
+  extract_parser.add_argument(
+    '--concurrency', type=int, default=1,
+    help='Maximum number of concurrent API calls'
+  )
+  extract_parser.add_argument('--lang', default='en', help='Language')
+  extract_parser.add_argument('--timezone', default='UTC', help='Timezone')
+  return parser
+
+
+def run_extract(args: argparse.Namespace) -> int:
+  ods = Opendatasoft(
+    subdomain=args.subdomain,
+    base_url=args.base_url,
+    api_key=args.api_key,
+    lang=args.lang,
+    timezone=args.timezone
+  )
+  query = ods.catalog.dataset(args.dataset).records.filter(*args.where)
+  if args.select:
+    query = query.select(*args.select)
+  if args.order_by:
+    query = query.order_by(*args.order_by)
+
+  format = args.format
+  if format is None:
+    extension = os.path.splitext(args.out)[1].lstrip('.')
+    format = extension if extension in extract.FORMATS else 'jsonl'
+
+  count = extract.Extraction(
+    query,
+    args.out,
+    format=format,
+    batch_size=args.batch_size,
+    concurrency=args.concurrency,
+    key=args.key
+  ).run()
+  print(f'Extracted {count} records to {args.out}', file=sys.stderr)
+  return 0
+
+
+def main(argv: List[str] = None) -> int:
+  args = parser().parse_args(argv)
+  logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+  if args.command == 'extract':
+    return run_extract(args)
+  return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
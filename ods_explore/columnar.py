@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import datetime
+import json
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+try:
+  import pyarrow as pa
+except ImportError:
+  pa = None
+
+
+def require_pyarrow() -> None:
+  if pa is None:
+    raise ImportError(
+      'pyarrow is required for columnar output. Install it with '
+      '`pip install ods-explore[arrow]`.'
+    )
+
+
+## Schemas ##
+
+def field_type(field: dict, timezone: str = 'UTC') -> pa.DataType:
+  """
+  Arrow type of an Opendatasoft field
+  :param field: Field metadata, from `models.Dataset.fields`
+  :param timezone: Timezone of datetime fields
+  """
+  require_pyarrow()
+  return {
+    'boolean': pa.bool_(),
+    'date': pa.date32(),
+    'datetime': pa.timestamp('us', tz=timezone),
+    'double': pa.float64(),
+    'geo_point_2d': pa.struct([('lon', pa.float64()), ('lat', pa.float64())]),
+    'int': pa.int64()
+  }.get(field.get('type'), pa.string())
+
+
+def schema(fields: List[dict], timezone: str = 'UTC') -> pa.Schema:
+  """
+  Arrow schema of a dataset's records
+  :param fields: Field metadata, from `models.Dataset.fields`
+  :param timezone: Timezone of datetime fields
+  """
+  require_pyarrow()
+  return pa.schema([
+    (field['name'], field_type(field, timezone=timezone))
+    for field in fields
+  ])
+
+
+def infer_schema(
+  items: List[dict],
+  fields: List[dict],
+  timezone: str = 'UTC'
+) -> pa.Schema:
+  """
+  Arrow schema of selected record fields. Dataset fields keep their type, and
+  the types of other expressions are inferred from their values.
+  :param items: Json-formatted records
+  :param fields: Field metadata, from `models.Dataset.fields`
+  :param timezone: Timezone of datetime fields
+  """
+  require_pyarrow()
+  fields = {field['name']: field for field in fields}
+  names = list(dict.fromkeys(
+    name
+    for item in items
+    for name in item['fields']
+  ))
+
+  columns = []
+  for name in names:
+    if name in fields:
+      columns.append((name, field_type(fields[name], timezone=timezone)))
+      continue
+    values = [item['fields'].get(name) for item in items]
+    dtype = pa.array(values).type
+    columns.append((name, pa.string() if pa.types.is_null(dtype) else dtype))
+  return pa.schema(columns)
+
+
+## Record batches ##
+
+def _datetime(value: str) -> datetime.datetime:
+  return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _date(value: str) -> datetime.date:
+  return datetime.date.fromisoformat(value[:10])
+
+def _string(value: Any) -> str:
+  return value if isinstance(value, str) else json.dumps(value)
+
+
+def converter(dtype: pa.DataType) -> Optional[Callable[[Any], Any]]:
+  """Function that converts json values to a python value of an Arrow type"""
+  if pa.types.is_timestamp(dtype):
+    return _datetime
+  if pa.types.is_date(dtype):
+    return _date
+  if pa.types.is_string(dtype):
+    return _string
+  return None
+
+
+def record_batch(items: List[dict], schema: pa.Schema) -> pa.RecordBatch:
+  """
+  Convert json-formatted records to an Arrow record batch.
+  :param items: Json-formatted records
+  :param schema: Arrow schema of the records' fields
+  """
+  require_pyarrow()
+  arrays = []
+  for field in schema:
+    values = [item['fields'].get(field.name) for item in items]
+    convert = converter(field.type)
+    if convert is not None:
+      values = [None if value is None else convert(value) for value in values]
+    arrays.append(pa.array(values, type=field.type))
+  return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def rechunk(
+  pages: Iterable[List[dict]],
+  size: int = None
+) -> Iterator[List[dict]]:
+  """
+  Regroup pages of items into chunks of a given size. The last chunk may be
+  smaller.
+  :param pages: Pages of items
+  :param size: Number of items per chunk. Default: keep pages as they are
+  """
+  if size is None:
+    yield from (page for page in pages if page)
+    return
+
+  buffer = []
+  for page in pages:
+    buffer.extend(page)
+    while len(buffer) >= size:
+      yield buffer[:size]
+      buffer = buffer[size:]
+  if buffer:
+    yield buffer
+
+
+## Sinks ##
+
+def write_parquet(
+  batches: Iterable[pa.RecordBatch],
+  path: str,
+  empty_schema: Callable[[], pa.Schema],
+  **kwargs: Any
+) -> None:
+  """
+  Write record batches to a Parquet file, as they arrive.
+  :param batches: Record batches
+  :param path: Output file path
+  :param empty_schema: Function that returns the file schema, if there are no
+    record batches
+  :param **kwargs: Kwargs to pass to pyarrow.parquet.ParquetWriter()
+  """
+  require_pyarrow()
+  import pyarrow.parquet as pq
+
+  writer = None
+  try:
+    for batch in batches:
+      if writer is None:
+        writer = pq.ParquetWriter(path, batch.schema, **kwargs)
+      writer.write_batch(batch)
+    if writer is None:
+      writer = pq.ParquetWriter(path, empty_schema(), **kwargs)
+  finally:
+    if writer is not None:
+      writer.close()
+
+
+def write_csv(
+  batches: Iterable[pa.RecordBatch],
+  path: str,
+  empty_schema: Callable[[], pa.Schema],
+  **kwargs: Any
+) -> None:
+  """
+  Write record batches to a CSV file, as they arrive. Struct columns are
+  flattened.
+  :param batches: Record batches
+  :param path: Output file path
+  :param empty_schema: Function that returns the file schema, if there are no
+    record batches
+  :param **kwargs: Kwargs to pass to pyarrow.csv.WriteOptions()
+  """
+  require_pyarrow()
+  import pyarrow.csv as csv
+
+  options = csv.WriteOptions(**kwargs)
+  writer = None
+  try:
+    for batch in batches:
+      table = pa.Table.from_batches([batch]).flatten()
+      if writer is None:
+        writer = csv.CSVWriter(path, table.schema, write_options=options)
+      writer.write_table(table)
+    if writer is None:
+      table = empty_schema().empty_table().flatten()
+      writer = csv.CSVWriter(path, table.schema, write_options=options)
+  finally:
+    if writer is not None:
+      writer.close()
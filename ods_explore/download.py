@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from . import exceptions
+from . import models
+from . import transport
+
+logger = logging.getLogger(__name__)
+
+# Name of the file that records the ETag and size of downloaded files, in the
+# download directory
+MANIFEST = '.attachments.json'
+
+# Suffix of partially downloaded files
+PARTIAL = '.part'
+
+# Ranges and sizes apply to the encoded content, so files are downloaded
+# unencoded
+HEADERS = {'Accept-Encoding': 'identity'}
+
+
+class Download(NamedTuple):
+  """Outcome of an attachment download"""
+
+  attachment: models.Attachment
+  path: str
+  # False if the file was up to date, and was not downloaded again
+  downloaded: bool
+
+
+class Downloader:
+  """
+  Download files to a directory, streaming each file to disk in chunks.
+  Interrupted downloads are resumed with HTTP range requests, and files that
+  haven't changed since they were downloaded (by ETag, or else by size) are
+  skipped.
+  """
+
+  def __init__(
+    self,
+    session: requests.Session,
+    directory: str,
+    chunk_size: int = 2**20,
+    limiter: transport.RateLimiter = None,
+    timeout: transport.Timeout = None
+  ) -> None:
+    """
+    :param session: A session object with which to make API calls
+    :param directory: Directory to download files to
+    :param chunk_size: Number of bytes to read and write at a time
+    :param limiter: If provided, API calls are limited to its rate
+    :param timeout: Timeout of API calls, in seconds, or as a (connect, read)
+      tuple
+    """
+    self.session = session
+    self.directory = directory
+    self.chunk_size = chunk_size
+    self.limiter = limiter
+    self.timeout = timeout
+    self._lock = threading.Lock()
+    os.makedirs(directory, exist_ok=True)
+    self.manifest = self.load_manifest()
+
+  ## Manifest ##
+
+  @property
+  def manifest_path(self) -> str:
+    return os.path.join(self.directory, MANIFEST)
+
+  def load_manifest(self) -> Dict[str, dict]:
+    """Get the ETag and size of downloaded files, by file name."""
+    if not os.path.exists(self.manifest_path):
+      return {}
+    with open(self.manifest_path) as f:
+      return json.load(f)
+
+  def record(self, filename: str, etag: Optional[str], size: int) -> None:
+    """Record a downloaded file, and atomically replace the manifest file."""
+    with self._lock:
+      self.manifest[filename] = {'etag': etag, 'size': size}
+      temp_path = f'{self.manifest_path}.tmp'
+      with open(temp_path, 'w') as f:
+        json.dump(self.manifest, f, indent=2, sort_keys=True)
+      os.replace(temp_path, self.manifest_path)
+
+  ## Downloads ##
+
+  def request(self, method: str, url: str, **kwargs) -> requests.Response:
+    if self.limiter is not None:
+      self.limiter.acquire()
+    try:
+      response = self.session.request(
+        method,
+        url,
+        timeout=self.timeout,
+        **kwargs
+      )
+    except (
+      requests.exceptions.ConnectionError,
+      requests.exceptions.Timeout
+    ) as ex:
+      raise exceptions.ConnectionError(ex)
+    except requests.exceptions.RequestException as ex:
+      raise exceptions.TransportError(ex)
+
+    logger.info(f'{method} {url} {response.status_code}')
+    if response.status_code >= 400:
+      raise exceptions.error_for(response)
+    return response
+
+  @staticmethod
+  def validators(response: requests.Response) -> Tuple[Optional[str], Optional[int]]:
+    """ETag and size of a file, from the headers of a full response"""
+    size = response.headers.get('Content-Length')
+    return response.headers.get('ETag'), int(size) if size else None
+
+  def is_current(
+    self,
+    filename: str,
+    etag: Optional[str],
+    size: Optional[int]
+  ) -> bool:
+    """Whether a downloaded file is the same as the remote file"""
+    path = os.path.join(self.directory, filename)
+    entry = self.manifest.get(filename)
+    if entry is None or not os.path.exists(path):
+      return False
+    if os.path.getsize(path) != entry['size']:
+      return False
+    if etag is not None and entry['etag'] is not None:
+      return etag == entry['etag']
+    return size is not None and size == entry['size']
+
+  def download(self, url: str, filename: str) -> Tuple[str, bool]:
+    """
+    Download a file, unless it's up to date.
+    :param url: File URL
+    :param filename: Name of the file in the download directory
+    :returns: (file path, whether the file was downloaded)
+    """
+    filename = os.path.basename(filename)
+    path = os.path.join(self.directory, filename)
+    partial_path = f'{path}{PARTIAL}'
+
+    head = self.request('HEAD', url, headers=HEADERS, allow_redirects=True)
+    etag, size = self.validators(head)
+    if self.is_current(filename, etag, size):
+      logger.info(f'{filename} is up to date')
+      return path, False
+
+    headers = dict(HEADERS)
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    if size is not None and offset >= size:
+      offset = 0
+    if offset:
+      headers['Range'] = f'bytes={offset}-'
+      # The partial file is only resumed if the remote file hasn't changed
+      headers['If-Range'] = etag or head.headers.get('Last-Modified', '')
+      if not headers['If-Range']:
+        del headers['Range'], headers['If-Range']
+
+    try:
+      response = self.request('GET', url, headers=headers, stream=True)
+    except exceptions.ResponseError as ex:
+      # The range starts past the end of the remote file, eg. for a complete
+      # partial file whose size wasn't known: start over
+      if ex.status != 416 or 'Range' not in headers:
+        raise
+      logger.info(f'Restarting {filename}: {ex}')
+      os.remove(partial_path)
+      del headers['Range'], headers['If-Range']
+      response = self.request('GET', url, headers=headers, stream=True)
+
+    with response:
+      if response.status_code == 206:
+        logger.info(f'Resuming {filename} at byte {offset}')
+        mode = 'ab'
+      else:
+        # The file changed, or the server ignored the range: start over
+        etag, size = self.validators(response)
+        mode = 'wb'
+      with open(partial_path, mode) as f:
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+          f.write(chunk)
+
+    written = os.path.getsize(partial_path)
+    if size is not None and written != size:
+      raise exceptions.TransportError(
+        f'Incomplete download of {filename}: {written} of {size} bytes'
+      )
+    os.replace(partial_path, path)
+    self.record(filename, etag, written)
+    return path, True
+
+  def download_all(
+    self,
+    files: List[Tuple[str, str]],
+    max_workers: int = 4
+  ) -> List[Tuple[str, bool]]:
+    """
+    Download files concurrently.
+    :param files: (file URL, file name) tuples. Repeated file names are
+      numbered, eg. `data_2.csv`
+    :param max_workers: Maximum number of concurrent downloads
+    :returns: (file path, whether the file was downloaded) tuples, in the order
+      of `files`
+    """
+    filenames = self.unique([filename for _, filename in files])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      futures = [
+        executor.submit(self.download, url, filename)
+        for (url, _), filename in zip(files, filenames)
+      ]
+      return [future.result() for future in futures]
+
+  @staticmethod
+  def unique(filenames: List[str]) -> List[str]:
+    """
+    Number repeated file names, in order, so that concurrent downloads never
+    share a file or a manifest entry.
+    """
+    names = [os.path.basename(filename) for filename in filenames]
+    taken = set()
+    unique = []
+    for name in names:
+      candidate, number = name, 1
+      stem, extension = os.path.splitext(name)
+      while candidate in taken or (candidate != name and candidate in names):
+        number += 1
+        candidate = f'{stem}_{number}{extension}'
+      taken.add(candidate)
+      unique.append(candidate)
+    return unique
@@ -17,12 +17,26 @@ class ConnectionError(TransportError):
   pass
 
 
+class DeadlineExceeded(OpendatasoftException):
+  """Exception for operations that run out of time"""
+  pass
+
+
+class CostExceeded(OpendatasoftException):
+  """Exception for queries that would cost more than their guard allows"""
+  pass
+
+
 class ResponseError(OpendatasoftException):
   """Base class for exceptions stemming from Opendatasoft responses"""
   
   def __init__(self, response):
     self.status = response.status_code
-    json = response.json()
+    try:
+      json = response.json()
+    except ValueError:
+      # Non-json responses, such as errors when downloading files
+      json = {'message': response.reason}
     self.error = json.get('error_code')
     self.message = json.get('message')
 
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+import csv
+import io
+import json
+import logging
+import os
+import time
+from typing import (
+  Any, Deque, Iterator, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+)
+
+from . import language as lang
+from . import plan
+from .query import literal
+
+if TYPE_CHECKING:
+  from .query import Query
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ['jsonl', 'csv']
+
+
+class Checkpoint(NamedTuple):
+  """Progress of an extraction, as of the last page written"""
+
+  # URL of the extracted query, to detect a different query on resume
+  url: str
+  # Number of results written
+  offset: int
+  # Number of bytes of output written
+  size: int
+  # Output columns (csv only)
+  columns: Optional[List[str]] = None
+  # Key of the last result written (keyset extractions only)
+  key: Any = None
+
+
+class Extraction:
+  """
+  Write query results to a file, one page at a time, recording progress in a
+  checkpoint file after each page. If the extraction is interrupted, running
+  it again resumes from the last page written.
+
+  Results are paged through by offset, which the API caps at
+  `plan.MAX_OFFSET` results. Larger extractions page through results by key
+  instead: ordered by a unique field, each page starts after the last key
+  written.
+  """
+
+  def __init__(
+    self,
+    query: Query,
+    path: str,
+    format: str = 'jsonl',
+    batch_size: int = 100,
+    concurrency: int = 1,
+    checkpoint_path: str = None,
+    key: str = None
+  ) -> None:
+    """
+    :param query: Query whose results to extract
+    :param path: Output file path
+    :param format: Output format, one of `jsonl` (one json-formatted result
+      per line) or `csv` (one row per record, with one column per field)
+    :param batch_size: Number of results to fetch per API call
+    :param concurrency: Maximum number of concurrent API calls
+    :param checkpoint_path: Checkpoint file path. Default: the output file
+      path, suffixed with `.checkpoint`
+    :param key: If provided, page through results by this unique, non-null
+      field, in ascending order, rather than by offset. Pages are then fetched
+      one at a time
+    """
+    if format not in FORMATS:
+      raise ValueError(f"Invalid format '{format}', expected one of {FORMATS}")
+    if key is not None and query._order_by:
+      raise ValueError(
+        f"Results are ordered by the key '{key}'. Remove order_by() from the "
+        'query'
+      )
+    self.query = query
+    self.path = path
+    self.format = format
+    self.batch_size = batch_size
+    self.concurrency = concurrency
+    self.checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+    self.key = key
+
+  ## Checkpoints ##
+
+  def load_checkpoint(self) -> Optional[Checkpoint]:
+    """Get the checkpoint of an interrupted extraction, if any."""
+    if not os.path.exists(self.checkpoint_path):
+      return None
+    with open(self.checkpoint_path) as f:
+      checkpoint = Checkpoint(**json.load(f))
+    if checkpoint.url != self.query.url():
+      raise ValueError(
+        f'Checkpoint {self.checkpoint_path} belongs to a different query. '
+        'Delete it to start over.'
+      )
+    return checkpoint
+
+  def save_checkpoint(self, checkpoint: Checkpoint) -> None:
+    """Atomically replace the checkpoint file."""
+    temp_path = f'{self.checkpoint_path}.tmp'
+    with open(temp_path, 'w') as f:
+      json.dump(checkpoint._asdict(), f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(temp_path, self.checkpoint_path)
+
+  def has_output(self, checkpoint: Checkpoint) -> bool:
+    """Whether the output file holds everything recorded in a checkpoint"""
+    return (
+      os.path.exists(self.path)
+      and os.path.getsize(self.path) >= checkpoint.size
+    )
+
+  ## Extraction ##
+
+  def run(self) -> int:
+    """
+    Extract all results, resuming from the checkpoint if there is one.
+    :returns: The total number of results written
+    """
+    checkpoint = self.load_checkpoint()
+    if checkpoint is not None and not self.has_output(checkpoint):
+      logger.warning(
+        f'{self.path} is missing output recorded in {self.checkpoint_path}. '
+        'Starting over'
+      )
+      checkpoint = None
+    if checkpoint is None:
+      checkpoint = Checkpoint(url=self.query.url(), offset=0, size=0)
+    else:
+      logger.info(f'Resuming extraction to {self.path} at {checkpoint.offset}')
+
+    mode = 'r+b' if checkpoint.size else 'wb'
+    with open(self.path, mode) as f:
+      # Drop output written after the last checkpoint
+      f.truncate(checkpoint.size)
+      f.seek(checkpoint.size)
+
+      pages = (
+        self.keyset_pages(checkpoint.key)
+        if self.key is not None
+        else self.pages(checkpoint.offset)
+      )
+      for items in pages:
+        if self.format == 'csv' and checkpoint.columns is None:
+          checkpoint = checkpoint._replace(columns=self.columns(items))
+          f.write(self.csv_header(checkpoint.columns))
+
+        f.write(self.serialize(items, checkpoint.columns))
+        f.flush()
+        os.fsync(f.fileno())
+        checkpoint = checkpoint._replace(
+          offset=checkpoint.offset + len(items),
+          size=f.tell(),
+          key=self.key_of(items[-1])
+        )
+        self.save_checkpoint(checkpoint)
+
+    if os.path.exists(self.checkpoint_path):
+      os.remove(self.checkpoint_path)
+    return checkpoint.offset
+
+  def pages(self, offset: int) -> Iterator[List[dict]]:
+    """
+    Get pages of json-formatted results, in order, fetching up to
+    `concurrency` pages at a time.
+    :param offset: Offset of the first result
+    """
+    items, count = self.page(offset, check=True)
+    if count > plan.MAX_OFFSET:
+      raise ValueError(
+        f'{count} results exceed the pagination limit of {plan.MAX_OFFSET}. '
+        'Extract them by key instead'
+      )
+    if items:
+      yield items
+    offset += len(items)
+
+    pending: Deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+      while offset < count or pending:
+        while offset < count and len(pending) < self.concurrency:
+          pending.append(executor.submit(self.page, offset))
+          offset += self.batch_size
+        items, _ = pending.popleft().result()
+        if items:
+          yield items
+
+  def keyset_pages(self, after: Any = None) -> Iterator[List[dict]]:
+    """
+    Get pages of json-formatted results, in order of the key field.
+    :param after: Key of the last result written, if any
+    """
+    ordered = self.query.order_by(self.key)
+    check = True
+    while True:
+      query = ordered
+      if after is not None:
+        query = ordered.filter(f'{lang.fld(self.key)} > {literal(after)}')
+      items, count = self.page(0, check=check, query=query)
+      if items:
+        yield items
+      if len(items) >= count or len(items) < self.batch_size:
+        return
+      after = self.key_of(items[-1])
+      check = False
+
+  def key_of(self, item: dict) -> Any:
+    """Key of a result, if the extraction is keyed"""
+    return None if self.key is None else self.row(item)[self.key]
+
+  def page(
+    self,
+    offset: int,
+    check: bool = False,
+    query: Query = None
+  ) -> Tuple[List[dict], int]:
+    """
+    Get a page of json-formatted results.
+    :param offset: Offset of the first result
+    :param check: If True, check the cost of the extraction against the
+      query's guard
+    :param query: Query to get results of. Default: the extracted query
+    :returns: (results, total number of results)
+    """
+    query = query or self.query
+    start = time.monotonic()
+    results = query._get(limit=self.batch_size, offset=offset)
+    items = [item[query.json_key] for item in results[query.json_key_plural]]
+    if check:
+      query._check_cost(
+        results,
+        len(items),
+        time.monotonic() - start,
+        self.batch_size,
+        1 if self.key is not None else self.concurrency
+      )
+    return items, results['total_count']
+
+  ## Serialization ##
+
+  def columns(self, items: List[dict]) -> List[str]:
+    """CSV columns: the dataset's fields, or the fields of the first page"""
+    if hasattr(self.query, '_dataset') and not self.query._select:
+      return [field['name'] for field in self.query._dataset().fields]
+    return list(dict.fromkeys(
+      name
+      for item in items
+      for name in self.row(item)
+    ))
+
+  @staticmethod
+  def row(item: dict) -> dict:
+    """CSV row of a result: a record's fields, or a dataset's attributes"""
+    fields = item.get('fields')
+    return fields if isinstance(fields, dict) else item
+
+  @staticmethod
+  def csv_header(columns: List[str]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(columns)
+    return buffer.getvalue().encode()
+
+  def serialize(self, items: List[dict], columns: Optional[List[str]]) -> bytes:
+    if self.format == 'jsonl':
+      return ''.join(f'{json.dumps(item)}\n' for item in items).encode()
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for item in items:
+      fields = self.row(item)
+      writer.writerow(
+        json.dumps(value) if isinstance(value, (dict, list)) else value
+        for value in (fields.get(column) for column in columns)
+      )
+    return buffer.getvalue().encode()
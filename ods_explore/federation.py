@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+import queue
+import threading
+from typing import (
+  Any, Callable, Dict, Iterator, List, NamedTuple, Union
+)
+
+import pandas as pd
+
+from . import transport
+from .opendatasoft import Opendatasoft
+from .query import CatalogQuery, Query
+
+logger = logging.getLogger(__name__)
+
+Build = Callable[[CatalogQuery], Query]
+
+
+class Federated(NamedTuple):
+  """A result, tagged with the base API URL of its domain"""
+
+  source: str
+  item: Union[dict, NamedTuple]
+
+
+class Done(NamedTuple):
+  """End of a domain's results"""
+
+  source: str
+
+
+class Descending:
+  """Sort key wrapper that reverses the order of a value"""
+
+  def __init__(self, value: Any) -> None:
+    self.value = value
+
+  def __eq__(self, other: Descending) -> bool:
+    return self.value == other.value
+
+  def __lt__(self, other: Descending) -> bool:
+    return other.value < self.value
+
+
+def sort_key(order_by: str, as_json: bool) -> Callable[[Federated], tuple]:
+  """
+  Sort key of results, from an ODSQL `order_by` clause. Null values come last.
+  :param order_by: A clause such as `population desc,name asc`
+  :param as_json: If True, results are json-formatted
+  """
+  orderings = []
+  for expression in order_by.split(','):
+    name, _, direction = expression.strip().partition(' ')
+    orderings.append((name.strip('`'), direction.strip() == 'desc'))
+
+  def key(result: Federated) -> tuple:
+    item = result.item if as_json else result.item._asdict()
+    fields = item.get('fields')
+    if not isinstance(fields, dict):
+      fields = item
+    return tuple(
+      (value is None, Descending(value) if descending else value)
+      for value, descending in (
+        (fields.get(name), descending)
+        for name, descending in orderings
+      )
+    )
+
+  return key
+
+
+class Federation:
+  """
+  Run the same query against several Opendatasoft domains concurrently, and
+  merge their results.
+  """
+
+  def __init__(
+    self,
+    domains: List[Union[str, Opendatasoft]],
+    rate_limit: float = None,
+    **kwargs: Any
+  ) -> None:
+    """
+    :param domains: Domains to query, as subdomains, base API URLs, or
+      Opendatasoft instances (for domains that need their own session or
+      API key)
+    :param rate_limit: Maximum number of API calls per second, per domain
+      (for domains given as subdomains or base API URLs)
+    :param **kwargs: Kwargs to pass to Opendatasoft(), for domains given as
+      subdomains or base API URLs
+    """
+    self.domains: Dict[str, Opendatasoft] = {}
+    for domain in domains:
+      if isinstance(domain, str):
+        option = 'base_url' if '://' in domain else 'subdomain'
+        domain = Opendatasoft(
+          **{option: domain},
+          rate_limit=rate_limit,
+          **kwargs
+        )
+      self.domains[domain.base_url] = domain
+    # Exceptions raised by each failed domain, in the last evaluation
+    self.errors: Dict[str, Exception] = {}
+
+  def queries(self, build: Build) -> Dict[str, Query]:
+    """
+    Build a query for each domain.
+    :param build: Function that builds a query from a domain's catalog, eg.
+      `lambda catalog: catalog.dataset('trees').records.filter(height__gt=10)`
+    """
+    return {
+      source: build(domain.catalog)
+      for source, domain in self.domains.items()
+    }
+
+  def count(self, build: Build) -> Dict[str, int]:
+    """
+    Get the number of results of each domain. Failed domains are omitted.
+    :param build: Function that builds a query from a domain's catalog
+    """
+    self.errors = {}
+    counts = {}
+    queries = self.queries(build)
+    with ThreadPoolExecutor(max_workers=len(queries) or 1) as executor:
+      futures = {
+        source: executor.submit(query.count)
+        for source, query in queries.items()
+      }
+      for source, future in futures.items():
+        try:
+          counts[source] = future.result()
+        except Exception as ex:
+          self._fail(source, ex)
+    return counts
+
+  def iterator(
+    self,
+    build: Build,
+    batch_size: int = 100,
+    as_json: bool = False,
+    prefetch: int = 2
+  ) -> Iterator[Federated]:
+    """
+    Get an iterator of results from every domain, tagged with their domain.
+    Results are fetched concurrently. If the query is ordered, results are
+    merged in that order; otherwise they're returned as they arrive. A domain
+    that fails stops returning results, and its exception is recorded in
+    `errors`, without affecting other domains.
+    :param build: Function that builds a query from a domain's catalog
+    :param batch_size: Number of results to fetch per API call
+    :param as_json: If True, results are json-formatted
+    :param prefetch: Number of pages to fetch ahead, per domain
+    """
+    self.errors = {}
+    queries = self.queries(build)
+    if not queries:
+      return
+
+    ordered = any(
+      query._order_by and not query._order_by.startswith('random(')
+      for query in queries.values()
+    )
+    # Ordered results need a queue per domain, to merge them
+    queues = {
+      source: queue.Queue(maxsize=prefetch) if ordered else None
+      for source in queries
+    }
+    shared = queue.Queue(maxsize=prefetch * len(queries))
+    stop = threading.Event()
+
+    executor = ThreadPoolExecutor(max_workers=len(queries))
+    try:
+      for source, query in queries.items():
+        executor.submit(
+          self._produce,
+          source,
+          query,
+          queues[source] or shared,
+          stop,
+          batch_size,
+          as_json
+        )
+
+      if ordered:
+        order_by = next(iter(queries.values()))._order_by
+        yield from heapq.merge(
+          *(self._consume(q, 1) for q in queues.values()),
+          key=sort_key(order_by, as_json)
+        )
+      else:
+        yield from self._consume(shared, len(queries))
+    finally:
+      stop.set()
+      executor.shutdown(wait=False)
+
+  def all(self, build: Build, batch_size: int = 100) -> List[Federated]:
+    """
+    Get all results from every domain.
+    :param build: Function that builds a query from a domain's catalog
+    :param batch_size: Number of results to fetch per API call
+    """
+    return list(self.iterator(build, batch_size=batch_size))
+
+  def dataframe(
+    self,
+    build: Build,
+    batch_size: int = 100,
+    **kwargs: Any
+  ) -> pd.DataFrame:
+    """
+    Get results from every domain as a Pandas DataFrame, with a `source`
+    column.
+    :param build: Function that builds a query from a domain's catalog
+    :param batch_size: Number of results to fetch per API call
+    :param **kwargs: Kwargs to pass to pandas.json_normalize()
+    """
+    items = (
+      {'source': result.source, **result.item}
+      for result in self.iterator(build, batch_size=batch_size, as_json=True)
+    )
+    return pd.json_normalize(items, **kwargs)
+
+  def _produce(
+    self,
+    source: str,
+    query: Query,
+    results: queue.Queue,
+    stop: threading.Event,
+    batch_size: int,
+    as_json: bool
+  ) -> None:
+    """Fetch a domain's pages of results into a queue, until stopped."""
+    try:
+      for items in query._pages(batch_size=batch_size):
+        page = [
+          Federated(source, json if as_json else query.model(**json))
+          for json in items
+        ]
+        if not transport.put(results, page, stop):
+          return
+    except Exception as ex:
+      self._fail(source, ex)
+    transport.put(results, Done(source), stop)
+
+  def _consume(self, results: queue.Queue, producers: int) -> Iterator[Federated]:
+    """Get results from a queue, until every producer is done."""
+    while producers:
+      page = results.get()
+      if isinstance(page, Done):
+        producers -= 1
+        continue
+      yield from page
+
+  def _fail(self, source: str, ex: Exception) -> None:
+    logger.warning(f'Query failed for {source}: {ex}')
+    self.errors[source] = ex
@@ -0,0 +1,76 @@
+import json
+from typing import List, Optional, Tuple, Union
+
+# (min longitude, min latitude, max longitude, max latitude)
+BBox = Tuple[float, float, float, float]
+
+# Padding applied to degenerate (zero-width or zero-height) boxes, in degrees
+EPSILON = 1e-6
+
+
+def bbox(geometry: Union[str, dict]) -> Optional[BBox]:
+  """
+  Get the bounding box of a GeoJSON geometry.
+  :param geometry: A GeoJSON geometry, feature, or geometry collection, as a
+    dictionary or string
+  :returns: The bounding box, or None if the geometry has no coordinates
+  """
+  if isinstance(geometry, str):
+    geometry = json.loads(geometry)
+
+  lons, lats = [], []
+
+  def walk(node: Union[dict, list]) -> None:
+    if isinstance(node, dict):
+      for key in ['coordinates', 'geometry', 'geometries']:
+        if node.get(key) is not None:
+          walk(node[key])
+    elif node and isinstance(node[0], (int, float)):
+      lons.append(node[0])
+      lats.append(node[1])
+    else:
+      for child in node:
+        walk(child)
+
+  walk(geometry)
+  if not lons:
+    return None
+  return pad((min(lons), min(lats), max(lons), max(lats)))
+
+
+def pad(box: BBox) -> BBox:
+  """Widen a degenerate bounding box, so that it describes a valid polygon."""
+  min_lon, min_lat, max_lon, max_lat = box
+  if min_lon == max_lon:
+    min_lon, max_lon = min_lon - EPSILON, max_lon + EPSILON
+  if min_lat == max_lat:
+    min_lat, max_lat = min_lat - EPSILON, max_lat + EPSILON
+  return min_lon, min_lat, max_lon, max_lat
+
+
+def split(box: BBox) -> List[BBox]:
+  """Split a bounding box into four quadrants."""
+  min_lon, min_lat, max_lon, max_lat = box
+  mid_lon = (min_lon + max_lon) / 2
+  mid_lat = (min_lat + max_lat) / 2
+  return [
+    (min_lon, min_lat, mid_lon, mid_lat),
+    (mid_lon, min_lat, max_lon, mid_lat),
+    (min_lon, mid_lat, mid_lon, max_lat),
+    (mid_lon, mid_lat, max_lon, max_lat)
+  ]
+
+
+def polygon(box: BBox) -> dict:
+  """GeoJSON polygon of a bounding box"""
+  min_lon, min_lat, max_lon, max_lat = box
+  return {
+    'type': 'Polygon',
+    'coordinates': [[
+      [min_lon, min_lat],
+      [max_lon, min_lat],
+      [max_lon, max_lat],
+      [min_lon, max_lat],
+      [min_lon, min_lat]
+    ]]
+  }
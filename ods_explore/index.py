@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+import re
+import unicodedata
+from typing import (
+  Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING, Union
+)
+
+from . import language as lang
+from . import models
+
+if TYPE_CHECKING:
+  from .query import DatasetsQuery
+
+# Default metas that are searched by full text
+TEXT_METAS = ['title', 'description', 'keyword', 'theme', 'publisher']
+
+# Default metas that datasets can be filtered by
+FACETS = ['theme', 'keyword', 'publisher', 'language', 'license']
+
+
+def normalize(text: str) -> str:
+  """Lowercase text, and remove accents."""
+  decomposed = unicodedata.normalize('NFKD', text.lower())
+  return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+  """Split text into normalized words, ignoring HTML tags."""
+  text = re.sub(r'<[^>]+>', ' ', text)
+  return [token for token in re.split(r'\W+', normalize(text)) if token]
+
+
+def values(meta: Union[str, List[str], None]) -> List[str]:
+  if meta is None:
+    return []
+  return [meta] if isinstance(meta, str) else [str(value) for value in meta]
+
+
+class CatalogIndex:
+  """
+  In-memory index of a catalog's datasets, for full-text search and facet
+  filtering without API calls.
+  """
+
+  def __init__(self, query: DatasetsQuery) -> None:
+    """
+    :param query: Datasets to index
+    """
+    self.query = query
+    self.datasets: Dict[str, models.Dataset] = {}
+    # Latest modification date of indexed datasets
+    self.modified: Optional[str] = None
+    self._postings: Dict[str, Set[str]] = {}
+    self._facets: Dict[str, Dict[str, Set[str]]] = {facet: {} for facet in FACETS}
+    # Original facet values, by normalized value
+    self._labels: Dict[str, str] = {}
+    # Tokens and facet values, by dataset id
+    self._documents: Dict[str, Set[str]] = {}
+    self._values: Dict[str, Set[Tuple[str, str]]] = {}
+    self._titles: Dict[str, Set[str]] = {}
+    self._tokens: Optional[List[str]] = None
+
+  def __len__(self) -> int:
+    return len(self.datasets)
+
+  def __contains__(self, dataset_id: str) -> bool:
+    return dataset_id in self.datasets
+
+  ## Indexing ##
+
+  def build(self, batch_size: int = 100) -> CatalogIndex:
+    """
+    Index every dataset, replacing the current index.
+    :param batch_size: Number of datasets to fetch per API call
+    """
+    self.clear()
+    self.update(self.query.iterator(batch_size=batch_size))
+    return self
+
+  def refresh(self, batch_size: int = 100) -> int:
+    """
+    Index datasets modified since the latest indexed modification, and drop
+    datasets that have been removed from the catalog.
+    :param batch_size: Number of datasets to fetch per API call
+    :returns: The number of datasets (re)indexed
+    """
+    if self.modified is None:
+      return len(self.build(batch_size=batch_size))
+
+    # Modification dates are only precise to the second, so datasets modified
+    # in the same second as the latest indexed one are indexed again
+    query = self.query.filter(modified__gte=lang.date(self.modified))
+    count = self.update(query.iterator(batch_size=batch_size))
+
+    listed = {
+      item['dataset_id']
+      for item in self.query.select('dataset_id').iterator(
+        batch_size=batch_size,
+        as_json=True
+      )
+    }
+    for dataset_id in set(self.datasets) - listed:
+      self.remove(dataset_id)
+    return count
+
+  def update(self, datasets: Iterable[models.Dataset]) -> int:
+    """
+    Add datasets to the index, replacing datasets with the same id.
+    :returns: The number of datasets added
+    """
+    count = 0
+    for dataset in datasets:
+      self.add(dataset)
+      count += 1
+    return count
+
+  def add(self, dataset: models.Dataset) -> None:
+    """Add a dataset to the index, replacing a dataset with the same id."""
+    dataset_id = dataset.dataset_id
+    self.remove(dataset_id)
+    metas = (dataset.metas or {}).get('default') or {}
+
+    tokens = {
+      token
+      for meta in TEXT_METAS
+      for value in values(metas.get(meta))
+      for token in tokenize(value)
+    }
+    tokens.update(tokenize(dataset_id))
+    for token in tokens:
+      self._postings.setdefault(token, set()).add(dataset_id)
+    self._documents[dataset_id] = tokens
+    self._titles[dataset_id] = set(tokenize(metas.get('title') or ''))
+
+    self._values[dataset_id] = set()
+    for facet, index in self._facets.items():
+      for value in values(metas.get(facet)):
+        index.setdefault(normalize(value), set()).add(dataset_id)
+        self._labels.setdefault(normalize(value), value)
+        self._values[dataset_id].add((facet, normalize(value)))
+
+    modified = metas.get('modified')
+    if modified and (self.modified is None or modified > self.modified):
+      self.modified = modified
+
+    self.datasets[dataset_id] = dataset
+    self._tokens = None
+
+  def remove(self, dataset_id: str) -> None:
+    """Remove a dataset from the index."""
+    if dataset_id not in self.datasets:
+      return
+    for token in self._documents.pop(dataset_id):
+      postings = self._postings[token]
+      postings.discard(dataset_id)
+      if not postings:
+        del self._postings[token]
+    for facet, value in self._values.pop(dataset_id):
+      ids = self._facets[facet][value]
+      ids.discard(dataset_id)
+      if not ids:
+        del self._facets[facet][value]
+    del self._titles[dataset_id]
+    del self.datasets[dataset_id]
+    self._tokens = None
+
+  def clear(self) -> None:
+    self.datasets.clear()
+    self.modified = None
+    self._postings.clear()
+    self._facets = {facet: {} for facet in FACETS}
+    self._labels.clear()
+    self._documents.clear()
+    self._values.clear()
+    self._titles.clear()
+    self._tokens = None
+
+  ## Querying ##
+
+  def _prefixed(self, prefix: str) -> Set[str]:
+    """Ids of datasets with a token that starts with a prefix"""
+    if self._tokens is None:
+      self._tokens = sorted(self._postings)
+    ids = set()
+    i = bisect_left(self._tokens, prefix)
+    while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+      ids |= self._postings[self._tokens[i]]
+      i += 1
+    return ids
+
+  def _filtered(self, **kwargs: Union[str, List[str]]) -> Set[str]:
+    """Ids of datasets that match facet values"""
+    ids = set(self.datasets)
+    for facet, value in kwargs.items():
+      if facet not in self._facets:
+        raise ValueError(f"Invalid facet '{facet}', expected one of {FACETS}")
+      index = self._facets[facet]
+      ids &= set().union(*(
+        index.get(normalize(item), set())
+        for item in values(value)
+      ))
+    return ids
+
+  def filter(self, **kwargs: Union[str, List[str]]) -> List[models.Dataset]:
+    """
+    Get datasets that match the given facet values, sorted by id.
+    :param **kwargs: Facet values, by facet. If a value is a list, datasets
+      that match any of its items are returned
+    """
+    return [
+      self.datasets[dataset_id]
+      for dataset_id in sorted(self._filtered(**kwargs))
+    ]
+
+  def search(
+    self,
+    text: str,
+    limit: int = None,
+    **kwargs: Union[str, List[str]]
+  ) -> List[models.Dataset]:
+    """
+    Get datasets whose title, description, keywords, themes, publisher or id
+    contain every word of a text, as a word or the start of a word. Datasets
+    with more words in their title come first.
+    :param text: Search text
+    :param limit: Maximum number of datasets to return
+    :param **kwargs: Facet values, as in `filter()`
+    """
+    tokens = tokenize(text)
+    ids = self._filtered(**kwargs)
+    for token in tokens:
+      ids &= self._prefixed(token)
+      if not ids:
+        break
+
+    def rank(dataset_id: str) -> tuple:
+      title = self._titles[dataset_id]
+      hits = sum(
+        any(word.startswith(token) for word in title)
+        for token in tokens
+      )
+      return -hits, dataset_id
+
+    return [
+      self.datasets[dataset_id]
+      for dataset_id in sorted(ids, key=rank)[:limit]
+    ]
+
+  def facets(self, facet: str) -> Dict[str, int]:
+    """
+    Get the number of datasets per value of a facet, by decreasing count.
+    :param facet: One of `FACETS`
+    """
+    index = self._facets[facet]
+    return dict(sorted(
+      ((self._labels[value], len(ids)) for value, ids in index.items()),
+      key=lambda item: (-item[1], item[0])
+    ))
@@ -1,6 +1,7 @@
 import json
+import random as _random
 import re
-from typing import NewType, Union
+from typing import List, NewType, Tuple, Union
 
 
 KEYWORDS = [
@@ -227,6 +228,19 @@ def sum(field: str) -> str:
   return f'sum({fld(field)})'
 
 
+## Ordering ##
+
+def random(seed: int = None) -> str:
+  """
+  Random ordering
+  :param seed: Random seed, so that the ordering is reproducible. Default: a
+    random seed
+  """
+  if seed is None:
+    seed = _random.randint(0, 1000)
+  return f'random({seed})'
+
+
 ## Ranges ##
 
 def drange():
@@ -234,3 +248,23 @@ def drange():
 
 def srange():
   raise NotImplementedError()
+
+
+## Parsing ##
+
+def parse_function(expression: str) -> Tuple[str, List[str]]:
+  """
+  Parse a function call, such as an aggregation function.
+  :param expression: A function call, eg. `percentile(population, 90)`
+  :returns: (function name, arguments), with backquotes removed from field
+    names
+  """
+  match = re.fullmatch(r'\s*(\w+)\((.*)\)\s*', expression)
+  if match is None:
+    raise ValueError(f"Invalid function call '{expression}'")
+  name, arguments = match.groups()
+  return name, [
+    argument.strip().strip('`')
+    for argument in arguments.split(',')
+    if argument.strip()
+  ]
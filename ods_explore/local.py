@@ -0,0 +1,447 @@
+from __future__ import annotations
+
+from copy import copy
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+import warnings
+
+import pandas as pd
+
+from . import language as lang
+from . import models
+from . import query as q
+
+# ODSQL literals, as made by `language.date()` and `language.geom()`
+DATE_LITERAL = re.compile(r"date'(.+)'")
+GEOM_LITERAL = re.compile(r"geom'.+'", re.DOTALL)
+
+# Field types that are converted to datetimes
+DATE_TYPES = ['date', 'datetime']
+
+
+class LocalQuery:
+  """
+  Query records held in memory, with the same chainable and evaluation methods
+  as a dataset's records query. Filters, orderings, selections and
+  aggregations run as vectorized operations on a Pandas DataFrame, without API
+  calls.
+  """
+
+  model = models.Record
+
+  def __init__(
+    self,
+    frame: pd.DataFrame,
+    meta: pd.DataFrame = None,
+    dates: Dict[str, str] = None
+  ) -> None:
+    """
+    :param frame: Record fields, one column per field, indexed by record id
+    :param meta: Record size and timestamp columns, indexed by record id
+    :param dates: Types (`date` or `datetime`) of the columns converted to
+      datetimes, by column, so that results are returned as strings
+    """
+    self.frame = frame
+    self.dates = dates or {}
+    self.meta = (
+      meta
+      if meta is not None
+      else pd.DataFrame({'size': None, 'timestamp': None}, index=frame.index)
+    )
+    self._where: List[q.Expression] = []
+    self._order_by: List[str] = []
+    self._select: Dict[str, str] = {}
+
+  @classmethod
+  def from_records(
+    cls,
+    items: List[dict],
+    fields: List[dict] = None
+  ) -> LocalQuery:
+    """
+    Create a query from json-formatted records.
+    :param items: Json-formatted records
+    :param fields: The dataset's fields, used to convert date and datetime
+      fields to datetimes
+    """
+    ids = pd.Index([item['id'] for item in items], name='id')
+    # Use nullable types, so that integer fields with null values stay integers
+    frame = pd.DataFrame([item['fields'] for item in items], index=ids)
+    frame = frame.convert_dtypes()
+    dates = {
+      field['name']: field['type']
+      for field in fields or []
+      if field.get('type') in DATE_TYPES and field['name'] in frame.columns
+    }
+    for name, type in dates.items():
+      frame[name] = pd.to_datetime(frame[name], utc=type == 'datetime')
+    meta = pd.DataFrame(
+      {
+        'size': [item.get('size') for item in items],
+        'timestamp': [item.get('timestamp') for item in items]
+      },
+      index=ids
+    )
+    return cls(frame, meta, dates)
+
+  @classmethod
+  def from_arrow(cls, table: Any) -> LocalQuery:
+    """
+    Create a query from an Arrow table of record fields (as returned by
+    `RecordsQuery.iter_batches()`). Records are identified by row number.
+    """
+    frame = table.to_pandas()
+    frame.index = frame.index.astype(str).rename('id')
+    return cls(frame)
+
+  def _clone(self) -> LocalQuery:
+    clone = copy(self)
+    clone._where = list(self._where)
+    clone._order_by = list(self._order_by)
+    clone._select = dict(self._select)
+    return clone
+
+  ## Evaluation ##
+
+  def _column(self, field: str) -> pd.Series:
+    if field in self.frame.columns:
+      return self.frame[field]
+    return pd.Series(None, index=self.frame.index, dtype=object)
+
+  def _operand(self, value: Any, expression: bool = False) -> Any:
+    """
+    Python value of a lookup value, or the column of an F expression.
+    :param expression: If True, strings are ODSQL expressions (as in
+      comparisons), rather than string literals
+    """
+    if isinstance(value, q.F):
+      return self._column(value.field)
+    if not isinstance(value, str):
+      return value
+    match = DATE_LITERAL.fullmatch(value)
+    if match is not None:
+      try:
+        return pd.Timestamp(match.group(1).replace('/', '-'))
+      except ValueError:
+        raise NotImplementedError(f"Can't evaluate '{value}' locally")
+    if expression or GEOM_LITERAL.fullmatch(value):
+      raise NotImplementedError(f"Can't evaluate '{value}' locally")
+    return value
+
+  @staticmethod
+  def _comparable(column: pd.Series, value: Any) -> Tuple[pd.Series, Any]:
+    """Convert a column to datetimes, to compare it with a date literal."""
+    if not isinstance(value, pd.Timestamp):
+      return column, value
+    if not pd.api.types.is_datetime64_any_dtype(column):
+      try:
+        with warnings.catch_warnings():
+          # Values that aren't ISO 8601 dates are parsed one by one
+          warnings.simplefilter('ignore', UserWarning)
+          column = pd.to_datetime(column, utc=value.tzinfo is not None)
+      except (TypeError, ValueError):
+        raise NotImplementedError(
+          f"Can't compare '{column.name}' with a date locally"
+        )
+    # Naive dates are compared in UTC with timezone-aware columns
+    if getattr(column.dt, 'tz', None) is not None and value.tzinfo is None:
+      value = value.tz_localize('UTC')
+    return column, value
+
+  def _mask(self, node: q.Expression) -> pd.Series:
+    """Boolean mask of the records that match an expression"""
+    if isinstance(node, q.And):
+      masks = [self._mask(child) for child in node.children]
+      return pd.concat(masks, axis=1).all(axis=1)
+    if isinstance(node, q.Or):
+      masks = [self._mask(child) for child in node.children]
+      return pd.concat(masks, axis=1).any(axis=1)
+    if isinstance(node, q.Not):
+      return ~self._mask(node.child)
+    if isinstance(node, q.Membership):
+      column = self._column(node.field)
+      values = [self._operand(value) for value in node.values]
+      for value in values:
+        column, _ = self._comparable(column, value)
+      return column.isin([self._comparable(column, value)[1] for value in values])
+    if isinstance(node, q.Condition):
+      return self._condition(node).fillna(False).astype(bool)
+    raise NotImplementedError(
+      f"Can't evaluate {node} locally; use field lookups instead of raw ODSQL"
+    )
+
+  def _condition(self, node: q.Condition) -> pd.Series:
+    column = self._column(node.field)
+    lookup = node.lookup
+    if lookup in [q.Lookup.INAREA, q.Lookup.INRANGE, q.Lookup.ISNULL]:
+      value = node.value
+    else:
+      comparison = lookup in [q.Lookup.GT, q.Lookup.GTE, q.Lookup.LT, q.Lookup.LTE]
+      value = self._operand(node.value, expression=comparison)
+      column, value = self._comparable(column, value)
+
+    if lookup == q.Lookup.CONTAINS:
+      pattern = rf'\b{re.escape(value)}\b'
+      return column.astype('string').str.contains(pattern, case=False)
+    if lookup == q.Lookup.GT:
+      return column > value
+    if lookup == q.Lookup.GTE:
+      return column >= value
+    if lookup == q.Lookup.LT:
+      return column < value
+    if lookup == q.Lookup.LTE:
+      return column <= value
+    if lookup == q.Lookup.ISNULL:
+      return column.isna() if value is True else column.notna()
+    if lookup == q.Lookup.INRANGE:
+      return self._inrange(column, value)
+    if lookup == q.Lookup.INAREA:
+      raise NotImplementedError("Can't evaluate `inarea` lookups locally")
+    return column == value
+
+  @staticmethod
+  def _inrange(column: pd.Series, value: Any) -> pd.Series:
+    """
+    Match a range, given as a (low, high) tuple or an ODSQL range such as
+    `[1..10[`.
+    """
+    if isinstance(value, (tuple, list)):
+      low, high = value
+      return column.between(low, high)
+
+    match = re.fullmatch(r'\s*([\[\]])(.*?)\.\.(.*?)([\[\]])\s*', value)
+    if match is None:
+      raise ValueError(f"Invalid range '{value}'")
+    opening, low, high, closing = match.groups()
+    low, high = float(low.strip()), float(high.strip())
+    above = column >= low if opening == '[' else column > low
+    below = column <= high if closing == ']' else column < high
+    return above & below
+
+  def _evaluate(self) -> pd.DataFrame:
+    """Record fields that match the query, in order and as selected"""
+    frame = self.frame
+    node = q.And.of(*self._where)
+    if node is not None:
+      frame = frame[self._mask(node)]
+
+    if self._order_by:
+      if self._order_by == ['?']:
+        frame = frame.sample(frac=1)
+      else:
+        frame = frame.sort_values(
+          by=[arg.lstrip('-') for arg in self._order_by],
+          ascending=[not arg.startswith('-') for arg in self._order_by],
+          na_position='last',
+          kind='stable'
+        )
+
+    if self._select:
+      frame = pd.DataFrame(
+        {
+          label: self._selected(frame, expression)
+          for label, expression in self._select.items()
+        },
+        index=frame.index
+      )
+    return frame
+
+  @staticmethod
+  def _selected(frame: pd.DataFrame, expression: str) -> pd.Series:
+    """Column of a selected field or arithmetic expression"""
+    if expression in frame.columns:
+      return frame[expression]
+    if re.fullmatch(r'\s*\w+\(.*\)\s*', expression):
+      raise NotImplementedError(
+        f"Can't select '{expression}' locally; use aggregate() for aggregations"
+      )
+    return frame.eval(expression)
+
+  def _items(self, frame: pd.DataFrame) -> Iterator[dict]:
+    """Json-formatted records of a frame"""
+    meta = self.meta.loc[frame.index]
+    for (record_id, fields), size, timestamp in zip(
+      frame.to_dict('index').items(),
+      meta['size'],
+      meta['timestamp']
+    ):
+      yield {
+        'id': record_id,
+        'fields': {
+          key: self._value(key, value)
+          for key, value in fields.items()
+          if not (value is None or value is pd.NA or value != value)
+        },
+        'size': size,
+        'timestamp': timestamp
+      }
+
+  def _value(self, key: str, value: Any) -> Any:
+    """Json value of a field, with datetimes formatted as by the API"""
+    if key not in self.dates or not isinstance(value, pd.Timestamp):
+      return value
+    if self.dates[key] == 'date':
+      return value.date().isoformat()
+    return value.isoformat()
+
+  ## Methods that evaluate queries ##
+
+  def get(
+    self,
+    as_json: bool = False,
+    limit: int = None,
+    offset: int = 0
+  ) -> List[Union[dict, NamedTuple]]:
+    """
+    Get results.
+    :param as_json: If True, results are json-formatted
+    :param limit: Maximum number of results
+    :param offset: Index of the first result
+    """
+    frame = self._evaluate()
+    end = None if limit is None else offset + limit
+    items = self._items(frame.iloc[offset:end])
+    return [item if as_json else self.model(**item) for item in items]
+
+  def count(self) -> int:
+    node = q.And.of(*self._where)
+    if node is None:
+      return len(self.frame)
+    return int(self._mask(node).sum())
+
+  def exists(self) -> bool:
+    return self.count() > 0
+
+  def iterator(
+    self,
+    batch_size: int = 100,
+    as_json: bool = False
+  ) -> Iterator[Union[dict, NamedTuple]]:
+    """
+    Get an iterator of results.
+    :param batch_size: Unused, for compatibility with Query.iterator()
+    :param as_json: If True, results are json-formatted
+    """
+    for item in self._items(self._evaluate()):
+      yield item if as_json else self.model(**item)
+
+  def all(self, batch_size: int = 100) -> List[NamedTuple]:
+    return list(self.iterator())
+
+  def dataframe(self, batch_size: int = 100, **kwargs: Any) -> pd.DataFrame:
+    """
+    Get results as a Pandas DataFrame, with the same columns as
+    Query.dataframe().
+    :param batch_size: Unused, for compatibility with Query.dataframe()
+    :param **kwargs: Kwargs to pass to pandas.json_normalize()
+    """
+    return pd.json_normalize(list(self._items(self._evaluate())), **kwargs)
+
+  def first(self) -> Optional[NamedTuple]:
+    items = self.get(limit=1)
+    return items[0] if items else None
+
+  def last(self) -> Optional[NamedTuple]:
+    frame = self._evaluate()
+    if frame.empty:
+      return None
+    return self.model(**next(self._items(frame.iloc[-1:])))
+
+  def aggregate(self, *args: str, **kwargs: str) -> dict:
+    """
+    Get a dictionary of aggregate values, computed with the aggregation
+    functions of `ods_explore.language`. Each argument specifies a value
+    that will be included in the output, and can be defined with a label.
+    """
+    if not args and not kwargs:
+      return {}
+
+    frame = self.frame
+    node = q.And.of(*self._where)
+    if node is not None:
+      frame = frame[self._mask(node)]
+    if frame.empty:
+      return {}
+
+    aggregations = {**{arg: arg for arg in args}, **kwargs}
+    return {
+      label: self._aggregate(frame, expression)
+      for label, expression in aggregations.items()
+    }
+
+  def _aggregate(self, frame: pd.DataFrame, expression: str) -> Any:
+    name, arguments = lang.parse_function(expression)
+    if name == 'count' and arguments in [[], ['*']]:
+      return len(frame)
+
+    field = arguments[0]
+    column = frame[field] if field in frame else pd.Series(dtype=float)
+    if name == 'avg':
+      value = column.mean()
+    elif name == 'count':
+      value = column.count()
+    elif name == 'max':
+      value = column.max()
+    elif name == 'min':
+      value = column.min()
+    elif name == 'median':
+      value = column.median()
+    elif name == 'percentile':
+      value = column.quantile(float(arguments[1]) / 100)
+    elif name == 'sum':
+      value = column.sum()
+    else:
+      raise NotImplementedError(f"Can't evaluate '{expression}' locally")
+    if pd.isna(value):
+      return None
+    if isinstance(value, pd.Timestamp):
+      return self._value(field, value)
+    # Convert numpy scalars to python values
+    return value.item() if hasattr(value, 'item') else value
+
+  ## Chainable querying methods ##
+
+  def filter(self, *args: q.Q, **kwargs: Any) -> LocalQuery:
+    """
+    Return results that match the given filters.
+    :param *args: Q expressions
+    :param **kwargs: Field lookups
+    """
+    node = q.Query._expression(*args, **kwargs)
+    clone = self._clone()
+    if node is not None:
+      clone._where.append(node)
+    return clone
+
+  def exclude(self, *args: q.Q, **kwargs: Any) -> LocalQuery:
+    """
+    Return results that do not match the given filters.
+    :param *args: Q expressions
+    :param **kwargs: Field lookups
+    """
+    node = q.Query._expression(*args, **kwargs)
+    clone = self._clone()
+    if node is not None:
+      clone._where.append(q.Not.of(node))
+    return clone
+
+  def select(self, *args: str, **kwargs: str) -> LocalQuery:
+    """
+    Select fields to return. Each argument is a field name, or an arithmetic
+    expression of fields (such as an F expression), and can be defined with a
+    label.
+    """
+    clone = self._clone()
+    clone._select.update({arg: arg for arg in args})
+    clone._select.update(kwargs)
+    return clone
+
+  def order_by(self, *args: str) -> LocalQuery:
+    """
+    Specify the order of results.
+    :param args: Field names, or `?` to order results randomly. Prepend field
+      names with `-` indicate descending order.
+    """
+    clone = self._clone()
+    clone._order_by = ['?'] if '?' in args else list(args)
+    return clone
@@ -4,6 +4,7 @@ from typing import Any, List, NamedTuple
 import urllib.parse
 
 from . import exceptions
+from . import transport
 from .language import Date
 
 logger = logging.getLogger(__name__)
@@ -13,11 +14,37 @@ class OpendatasoftCore:
   """Core API interface"""
 
   def __init__(
-    self, base_url: str, session: requests.Session, resource: str = 'catalog',
+    self,
+    base_url: str,
+    session: requests.Session,
+    resource: str = 'catalog',
+    flight: transport.SingleFlight = None,
+    limiter: transport.RateLimiter = None,
+    hedger: transport.Hedger = None,
+    timeout: transport.Timeout = None,
+    compact_membership: bool = False
   ) -> None:
+    """
+    :param base_url: Base API URL
+    :param session: A session object with which to make API calls
+    :param resource: API resource
+    :param flight: If provided, concurrent identical API calls are coalesced
+      into one
+    :param limiter: If provided, API calls are limited to its rate
+    :param hedger: If provided, slow API calls are hedged with a duplicate call
+    :param timeout: Timeout of API calls, in seconds, or as a (connect, read)
+      tuple
+    :param compact_membership: If True, `in` lookups render as
+      `field in (a, b)` rather than `field = a or field = b`
+    """
     self.base_url = base_url
     self.session = session
     self.resource = resource
+    self.flight = flight
+    self.limiter = limiter
+    self.hedger = hedger
+    self.timeout = timeout
+    self.compact_membership = compact_membership
 
   @property
   def api_url(self) -> str:
@@ -40,13 +67,60 @@ class OpendatasoftCore:
   def build_url(self, *args: str) -> str:
     return '/'.join([self.api_url, *args])
 
-  def get(self, url: str) -> requests.Response:
+  def get(self, url: str, deadline: transport.Deadline = None) -> dict:
+    """
+    Get the json response of an API call.
+    :param url: API call URL
+    :param deadline: If provided, the call fails with DeadlineExceeded once it
+      passes
+    """
+    return self.get_response(url, deadline=deadline).json()
+
+  def get_response(
+    self,
+    url: str,
+    deadline: transport.Deadline = None
+  ) -> requests.Response:
+    """
+    Get the response of an API call, coalesced and hedged if enabled.
+    :param url: API call URL
+    :param deadline: If provided, the call fails with DeadlineExceeded once it
+      passes
+    """
+    def fetch() -> requests.Response:
+      if self.hedger is None:
+        return self.fetch(url, deadline)
+      return self.hedger.do(lambda: self.fetch(url, deadline))
+
+    # Calls with a deadline aren't coalesced, so that one caller's deadline
+    # never cuts short another caller's call
+    if self.flight is None or deadline is not None:
+      return fetch()
+    key = (url, transport.identity(self.session))
+    return self.flight.do(key, fetch)
+
+  def fetch(
+    self,
+    url: str,
+    deadline: transport.Deadline = None
+  ) -> requests.Response:
+    timeout = self.timeout
+    if deadline is not None:
+      deadline.check()
+    if self.limiter is not None:
+      self.limiter.acquire()
+    if deadline is not None:
+      # Checks the deadline and caps the timeout with a single reading of the
+      # clock
+      timeout = deadline.timeout(timeout)
     try:
-      response = self.session.get(url)
+      response = self.session.get(url, timeout=timeout)
     except (
       requests.exceptions.ConnectionError,
       requests.exceptions.Timeout
     ) as ex:
+      if deadline is not None and deadline.expired:
+        raise deadline.error() from ex
       raise exceptions.ConnectionError(ex)
     except requests.exceptions.RequestException as ex:
       raise exceptions.TransportError(ex)
@@ -55,7 +129,7 @@ class OpendatasoftCore:
     if response.status_code != 200:
       raise exceptions.error_for(response)
 
-    return response.json()
+    return response
 
 
 class Dataset(NamedTuple):
@@ -88,4 +162,19 @@ class Facet(NamedTuple):
 
 
 class Attachment(NamedTuple):
-  pass
+  href: str
+  metas: dict
+
+  @property
+  def id(self) -> str:
+    return self.metas.get('id') or self.href.rstrip('/').split('/')[-1]
+
+  @property
+  def filename(self) -> str:
+    """Name of the attached file"""
+    url = self.metas.get('url') or ''
+    name = url.split('://')[-1].rstrip('/').split('/')[-1]
+    return name or self.metas.get('title') or self.id
+
+  def __str__(self) -> str:
+    return f'<Attachment: {self.id}>'
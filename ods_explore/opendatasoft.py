@@ -2,9 +2,11 @@ from __future__ import annotations
 
 import logging
 import requests
+from typing import Optional, Tuple, Union
 
 from . import auth
 from . import query
+from . import transport
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +19,13 @@ class Opendatasoft:
     session: requests.Session = None,
     api_key: str = None,
     lang: str = 'en',
-    timezone: str = 'UTC'
+    timezone: str = 'UTC',
+    schema_max_age: float = None,
+    coalesce: bool = True,
+    rate_limit: float = None,
+    hedge: Union[bool, transport.Hedger] = False,
+    timeout: Union[float, Tuple[Optional[float], Optional[float]]] = None,
+    compact_membership: bool = False
   ) -> None:
     """
     :param subdomain: Subdomain used to create the base API URL,
@@ -30,6 +38,19 @@ class Opendatasoft:
       `date_format` method)
     :param timezone: Timezone applied to datetime fields in queries and
       responses
+    :param schema_max_age: Number of seconds after which cached dataset fields
+      and metadata are fetched again. Default: never expire
+    :param coalesce: If True, concurrent identical API calls (from different
+      threads) are coalesced into one
+    :param rate_limit: Maximum number of API calls per second
+    :param hedge: If True, API calls slower than the 95th percentile of recent
+      calls are hedged with a duplicate call, within a budget of 5% extra
+      calls. Pass a transport.Hedger to customize the percentile and budget
+    :param timeout: Timeout of each API call, in seconds, or as a
+      (connect, read) tuple. Default: no timeout
+    :param compact_membership: If True, `in` lookups and merged equalities are
+      rendered as `field in (a, b)` rather than `field = a or field = b`. Only
+      enable this for domains whose ODSQL supports list membership
     """
     self.base_url = (
       base_url.strip('/')
@@ -37,17 +58,25 @@ class Opendatasoft:
       else f'https://{subdomain}.opendatasoft.com'
     )
     self.session = session or requests.Session()
+    self.hedger = transport.Hedger() if hedge is True else hedge or None
     if api_key:
       self.login(api_key)
 
     self.catalog = query.CatalogQuery(
       api_options={
         'base_url': self.base_url,
-        'session': self.session
+        'session': self.session,
+        'flight': transport.SingleFlight() if coalesce else None,
+        'limiter': transport.RateLimiter(rate_limit) if rate_limit else None,
+        'hedger': self.hedger,
+        'timeout': timeout,
+        'compact_membership': compact_membership
       },
       lang=lang,
-      timezone=timezone
+      timezone=timezone,
+      schema_max_age=schema_max_age
     )
+    self.schemas = self.catalog.schemas
 
   def login(self, api_key: str) -> None:
     """Login to an Opendatasoft domain to access private datasets."""
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import json
+import multiprocessing
+import queue
+import threading
+import time
+from typing import (
+  Any, Callable, Deque, Dict, Iterator, List, Optional, Type, TYPE_CHECKING
+)
+
+import pandas as pd
+
+from . import transport
+
+if TYPE_CHECKING:
+  from .query import Query
+
+# End of the pages to decode
+DONE = None
+
+
+## Decoding stages, run in worker processes ##
+
+def decode(
+  json_key: str,
+  json_key_plural: str,
+  model: Optional[Type],
+  body: bytes
+) -> List[Any]:
+  """
+  Decode a page of results.
+  :param json_key: Key of a result's attributes
+  :param json_key_plural: Key of the list of results
+  :param model: If provided, results are instances of this model. Otherwise,
+    they're json-formatted
+  :param body: Response body of the page
+  """
+  results = json.loads(body)
+  items = [item[json_key] for item in results[json_key_plural]]
+  return items if model is None else [model(**item) for item in items]
+
+
+def normalize(
+  json_key: str,
+  json_key_plural: str,
+  kwargs: Dict[str, Any],
+  body: bytes
+) -> pd.DataFrame:
+  """
+  Decode a page of results into a Pandas DataFrame.
+  :param kwargs: Kwargs to pass to pandas.json_normalize()
+  """
+  return pd.json_normalize(decode(json_key, json_key_plural, None, body), **kwargs)
+
+
+class Pipeline:
+  """
+  Fetch pages of results in a thread, and decode them in a pool of worker
+  processes, so that network I/O and decoding overlap. Stages are connected by
+  bounded queues, so that fetching stays at most a few pages ahead of the
+  consumer.
+  """
+
+  def __init__(
+    self,
+    query: Query,
+    decode: Callable[[bytes], Any],
+    batch_size: int = 100,
+    workers: int = 2,
+    deadline: transport.Deadline = None
+  ) -> None:
+    """
+    :param query: Query whose results to fetch
+    :param decode: Picklable function that decodes a page's response body
+    :param batch_size: Number of results to fetch per API call
+    :param workers: Number of worker processes
+    :param deadline: If provided, API calls fail once it passes
+    """
+    self.query = query
+    self.decode = decode
+    self.batch_size = batch_size
+    self.workers = workers
+    self.deadline = deadline
+
+  def __iter__(self) -> Iterator[Any]:
+    """Get decoded pages, in order."""
+    pages = queue.Queue(maxsize=self.workers)
+    stop = threading.Event()
+    pending: Deque[Future] = deque()
+    error: Optional[BaseException] = None
+    done = False
+
+    # Spawn worker processes rather than forking them, since forking while
+    # other threads (of callers, hedgers or tiles) hold locks can deadlock them
+    executor = ProcessPoolExecutor(
+      max_workers=self.workers,
+      mp_context=multiprocessing.get_context('spawn')
+    )
+    try:
+      threading.Thread(
+        target=self._fetch,
+        args=(pages, stop),
+        daemon=True
+      ).start()
+
+      while not done or pending:
+        if pending and (
+          done or len(pending) >= self.workers or pending[0].done()
+        ):
+          yield pending.popleft().result()
+          continue
+
+        try:
+          # Poll while pages are decoding, so they're yielded as they finish
+          page = pages.get(timeout=transport.POLL_INTERVAL if pending else None)
+        except queue.Empty:
+          continue
+        if page is DONE:
+          done = True
+        elif isinstance(page, BaseException):
+          # Decode pages fetched before the error first
+          error, done = page, True
+        else:
+          pending.append(executor.submit(self.decode, page))
+    finally:
+      stop.set()
+      for future in pending:
+        future.cancel()
+      executor.shutdown(wait=False)
+
+    if error is not None:
+      raise error
+
+  def _fetch(self, pages: queue.Queue, stop: threading.Event) -> None:
+    """Fetch the response bodies of pages into a queue, until stopped."""
+    query = self.query
+    try:
+      offset = 0
+      count = None
+      while count is None or offset < count:
+        start = time.monotonic()
+        response = query.get_response(
+          query.url(limit=self.batch_size, offset=offset),
+          deadline=self.deadline
+        )
+        seconds = time.monotonic() - start
+        # Parse pages here only when needed, since decoding is the workers' job
+        if count is None or query._observing:
+          results = response.json()
+          query._observe(
+            item[query.json_key] for item in results[query.json_key_plural]
+          )
+        if count is None:
+          count = results['total_count']
+          size = len(results[query.json_key_plural])
+          query._check_cost(
+            results,
+            size,
+            seconds,
+            self.batch_size
+          )
+          if not size:
+            count = 0
+        offset += self.batch_size
+        if not transport.put(pages, response.content, stop):
+          return
+    except BaseException as ex:
+      transport.put(pages, ex, stop)
+      return
+    transport.put(pages, DONE, stop)
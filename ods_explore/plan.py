@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import math
+from typing import List, NamedTuple, Optional
+
+from . import exceptions
+
+# Maximum offset + limit of API calls: results past it can't be paged through
+MAX_OFFSET = 10000
+
+# URL length above which API calls risk being rejected by servers and proxies
+MAX_URL_LENGTH = 4096
+
+
+class Probe(NamedTuple):
+  """Measurement of an API call"""
+
+  # Number of results returned
+  results: int
+  # Size of the (uncompressed) response body
+  bytes: int
+  seconds: float
+
+  @classmethod
+  def of(cls, body: dict, results: int, seconds: float) -> Probe:
+    """Measure an API call from its json response."""
+    return cls(results, len(json.dumps(body).encode()), seconds)
+
+
+class Plan(NamedTuple):
+  """Estimated cost of fetching every result of a query"""
+
+  count: int
+  requests: int
+  bytes: int
+  seconds: float
+  warnings: List[str]
+
+  def __str__(self) -> str:
+    lines = [
+      f'{self.count} results, in {self.requests} API calls',
+      f'~{self.bytes:,} bytes, ~{self.seconds:.1f} seconds',
+      *(f'Warning: {warning}' for warning in self.warnings)
+    ]
+    return '\n'.join(lines)
+
+
+def estimate(
+  count: int,
+  batch_size: int,
+  concurrency: int,
+  page: Probe,
+  empty: Probe = None,
+  warnings: List[str] = None
+) -> Plan:
+  """
+  Estimate the cost of fetching every result of a query, from measured API
+  calls.
+  :param count: Number of results
+  :param batch_size: Number of results to fetch per API call
+  :param concurrency: Number of concurrent API calls
+  :param page: An API call that returned results
+  :param empty: An API call that returned no results, to tell the fixed cost
+    of API calls from the cost per result. Default: no fixed cost
+  :param warnings: Problems with the query
+  """
+  empty = empty or Probe(0, 0, 0.0)
+  requests = max(1, math.ceil(count / batch_size))
+  per_result_bytes = per_result_seconds = 0.0
+  if page.results:
+    per_result_bytes = max(0, page.bytes - empty.bytes) / page.results
+    per_result_seconds = max(0.0, page.seconds - empty.seconds) / page.results
+
+  rounds = math.ceil(requests / max(1, concurrency))
+  return Plan(
+    count=count,
+    requests=requests,
+    bytes=round(requests * empty.bytes + count * per_result_bytes),
+    seconds=rounds * (empty.seconds + min(batch_size, count) * per_result_seconds),
+    warnings=warnings or []
+  )
+
+
+def warnings(url: str, count: int, batch_size: int, max_limit: int) -> List[str]:
+  """
+  Problems that would make fetching every result of a query fail.
+  :param url: URL of the query's API calls
+  :param count: Number of results
+  :param batch_size: Number of results to fetch per API call
+  :param max_limit: Maximum number of results per API call
+  """
+  found = []
+  if count > MAX_OFFSET:
+    found.append(
+      f'{count} results exceed the pagination limit (offset + limit <= '
+      f'{MAX_OFFSET}), so results past {MAX_OFFSET} can\'t be paged through. '
+      'Narrow the query, or use tiled_iterator()'
+    )
+  if batch_size > max_limit:
+    found.append(
+      f'batch_size {batch_size} exceeds the maximum of {max_limit} results '
+      'per API call'
+    )
+  if len(url) > MAX_URL_LENGTH:
+    found.append(
+      f'URL is {len(url)} characters long, and may be rejected (over '
+      f'{MAX_URL_LENGTH}). Simplify the where clause'
+    )
+  return found
+
+
+class Guard(NamedTuple):
+  """Maximum cost of a query"""
+
+  max_requests: Optional[int] = None
+  max_bytes: Optional[int] = None
+  max_seconds: Optional[float] = None
+
+  def check(self, plan: Plan) -> None:
+    """Raise CostExceeded if a plan costs more than allowed."""
+    exceeded = [
+      f'{name} {round(value, 1):,} > {limit:,}'
+      for name, value, limit in [
+        ('requests', plan.requests, self.max_requests),
+        ('bytes', plan.bytes, self.max_bytes),
+        ('seconds', plan.seconds, self.max_seconds)
+      ]
+      if limit is not None and value > limit
+    ]
+    if exceeded:
+      raise exceptions.CostExceeded(
+        f'Query of {plan.count} results exceeds its cost guard: '
+        f'{", ".join(exceeded)}'
+      )
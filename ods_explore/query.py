@@ -1,16 +1,48 @@
 from __future__ import annotations
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from dataclasses import dataclass
+import functools
+import logging
 import pandas as pd
-import random
-from typing import Any, Dict, List, NamedTuple, NewType, Optional, Tuple, Union
+import queue
+import threading
+import time
+from typing import (
+  Any, ClassVar, Dict, Iterable, Iterator, List, NamedTuple, NewType, Optional, Tuple, Union
+)
 import urllib.parse
 
+from . import columnar
+from . import download
+from . import exceptions
+from . import geo
+from . import index
 from . import language as lang
+from . import local
 from . import models
+from . import pipeline
+from . import plan
+from . import sampling
+from . import schema
+from . import transport
+
+logger = logging.getLogger(__name__)
 
 ODSQL = NewType('ODSQL', str)
 
+# Maximum number of results per API call
+MAX_LIMIT = 100
+
+
+class Probed(NamedTuple):
+  """A measured API call, and the number of results of its query"""
+
+  probe: plan.Probe
+  count: int
+
 
 class Lookup:
   """Field lookups"""
@@ -52,10 +84,231 @@ class Lookup:
     return trimmed
 
 
+## Expression tree ##
+
+# Operator precedence, from loosest to tightest
+OR, AND, ATOM = range(3)
+
+
+def literal(value: Any) -> Any:
+  """ODSQL literal of a lookup value"""
+  return lang.str(value) if isinstance(value, str) else value
+
+
+class Expression:
+  """Base class of ODSQL expression tree nodes"""
+
+  precedence = ATOM
+
+  def render(self, annotations: dict, compact: bool = False) -> ODSQL:
+    """
+    Render this expression as ODSQL.
+    :param annotations: Labels that field names refer to
+    :param compact: If True, render memberships as `field in (a, b)` rather
+      than `field = a or field = b`. Only for domains whose ODSQL supports list
+      membership
+    """
+    raise NotImplementedError()
+
+  def binding(self, compact: bool) -> int:
+    """Precedence of this expression, as rendered"""
+    return self.precedence
+
+  def wrap(self, annotations: dict, precedence: int, compact: bool = False) -> ODSQL:
+    """Render this expression, with parentheses if it binds loosely."""
+    odsql = self.render(annotations, compact)
+    return f'({odsql})' if self.binding(compact) < precedence else odsql
+
+
+@dataclass(frozen=True)
+class Condition(Expression):
+  """A field lookup"""
+
+  field: str
+  lookup: Optional[str]
+  value: Any
+
+  @classmethod
+  def parse(cls, key: str, value: Any) -> Expression:
+    """
+    Create an expression from a lookup parameter.
+    :param key: Lookup key, eg. `population__gt`
+    :param value: Lookup value
+    """
+    field, lookup = Lookup.parse(key)
+    if lookup == Lookup.IN:
+      return Membership(field, tuple(value))
+    return cls(field, lookup, value)
+
+  @property
+  def is_equality(self) -> bool:
+    return self.lookup in [None, Lookup.EXACT] and not isinstance(self.value, bool)
+
+  def render(self, annotations: dict, compact: bool = False) -> ODSQL:
+    field = lang.fld(annotations.get(self.field, self.field))
+    lookup, value = self.lookup, self.value
+
+    if lookup == Lookup.CONTAINS:
+      op, query = 'like', lang.str(value)
+    elif lookup == Lookup.GT:
+      op, query = '>', value
+    elif lookup == Lookup.GTE:
+      op, query = '>=', value
+    elif lookup == Lookup.LT:
+      op, query = '<', value
+    elif lookup == Lookup.LTE:
+      op, query = '<=', value
+    elif lookup == Lookup.INAREA:
+      # Substitute the field placeholder only, since GeoJSON literals
+      # contain braces of their own
+      return value.replace('{}', field, 1)
+    elif lookup == Lookup.INRANGE:
+      op, query = 'in', value
+    elif lookup == Lookup.ISNULL:
+      op, query = 'is', f'{"" if value is True else "not "}null'
+    elif isinstance(value, bool):
+      op, query = 'is', str(value).lower()
+    else:
+      op, query = '=', literal(value)
+
+    return f'{field} {op} {query}'
+
+
+@dataclass(frozen=True)
+class Membership(Expression):
+  """A field equal to any one of several values"""
+
+  field: str
+  values: tuple
+
+  def binding(self, compact: bool) -> int:
+    return OR if len(self.values) > 1 and not compact else ATOM
+
+  def render(self, annotations: dict, compact: bool = False) -> ODSQL:
+    field = lang.fld(annotations.get(self.field, self.field))
+    values = sorted(set(str(literal(value)) for value in self.values))
+
+    if not values:
+      return 'false'
+    if len(values) == 1:
+      return f'{field} = {values[0]}'
+    if compact:
+      return f'{field} in ({", ".join(values)})'
+    return ' or '.join(f'{field} = {value}' for value in values)
+
+
+@dataclass(frozen=True)
+class Raw(Expression):
+  """A raw ODSQL expression"""
+
+  precedence = OR
+
+  odsql: str
+
+  def render(self, annotations: dict, compact: bool = False) -> ODSQL:
+    return self.odsql
+
+
+@dataclass(frozen=True)
+class Connective(Expression):
+  """Expressions joined by a boolean operator"""
+
+  operator: ClassVar[str]
+
+  children: Tuple[Expression, ...]
+
+  @classmethod
+  def of(cls, *children: Optional[Expression]) -> Optional[Expression]:
+    """
+    Join expressions, flattening nested expressions joined by the same
+    operator.
+    """
+    flat = []
+    for child in children:
+      if child is None:
+        continue
+      if isinstance(child, cls):
+        flat.extend(child.children)
+      else:
+        flat.append(child)
+
+    flat = cls.simplify(flat)
+    if not flat:
+      return None
+    if len(flat) == 1:
+      return flat[0]
+    return cls(tuple(flat))
+
+  @classmethod
+  def simplify(cls, children: List[Expression]) -> List[Expression]:
+    return children
+
+  def render(self, annotations: dict, compact: bool = False) -> ODSQL:
+    # Drop duplicates and sort, so that equivalent expressions render the same
+    operands = sorted(set(
+      child.wrap(annotations, self.precedence, compact)
+      for child in self.children
+    ))
+    return f' {self.operator} '.join(operands)
+
+
+class And(Connective):
+  operator = 'and'
+  precedence = AND
+
+
+class Or(Connective):
+  operator = 'or'
+  precedence = OR
+
+  @classmethod
+  def simplify(cls, children: List[Expression]) -> List[Expression]:
+    """Merge equalities and memberships of the same field."""
+    memberships: Dict[str, List[Any]] = {}
+    simplified = []
+    for child in children:
+      if isinstance(child, Condition) and child.is_equality:
+        values = [child.value]
+      elif isinstance(child, Membership):
+        values = list(child.values)
+      else:
+        simplified.append(child)
+        continue
+      if child.field not in memberships:
+        memberships[child.field] = []
+        simplified.append(child.field)
+      memberships[child.field].extend(values)
+
+    return [
+      Membership(child, tuple(memberships[child]))
+      if isinstance(child, str)
+      else child
+      for child in simplified
+    ]
+
+
+@dataclass(frozen=True)
+class Not(Expression):
+  child: Expression
+
+  @classmethod
+  def of(cls, child: Optional[Expression]) -> Optional[Expression]:
+    if child is None:
+      return None
+    if isinstance(child, Not):
+      return child.child
+    return cls(child)
+
+  def render(self, annotations: dict, compact: bool = False) -> ODSQL:
+    # Always include parentheses, since `not` may apply to > 1 expression
+    return f'not ({self.child.render(annotations, compact)})'
+
+
 class Q:
   """
   Represent complex queries using field lookups, which can be combined with
-  bitwise boolean operators.
+  bitwise boolean operators. Queries are stored as an expression tree, and
+  compiled to ODSQL once.
   """
 
   def __init__(self, **kwargs: Any) -> None:
@@ -63,86 +316,46 @@ class Q:
     :param **kwargs: Lookup parameters
     """
     self.kwargs = kwargs
-    self.raw = ''
+    self.node = And.of(*(
+      Condition.parse(key, value)
+      for key, value in kwargs.items()
+    ))
     self._annotations = {}
+    self._odsql = None
+
+  @classmethod
+  def from_node(cls, node: Optional[Expression]) -> Q:
+    q = cls()
+    q.node = node
+    return q
 
   def __and__(self, other: Q) -> Q:
     """a & b"""
-    q = Q()
-    q.raw = f'{self.odsql} and {other.odsql}'
-    return q
+    return Q.from_node(And.of(self.node, other.node))
 
   def __or__(self, other: Q) -> Q:
     """a | b"""
-    q = Q()
-    # Include parentheses because `and` has precedence over `or`
-    q.raw = f'({self.odsql} or {other.odsql})'
-    return q
+    return Q.from_node(Or.of(self.node, other.node))
 
   def __invert__(self) -> Q:
     """~a"""
-    q = Q()
-    odsql = self.odsql
-    # Include parentheses because inversion may apply to > 1 expression
-    if not (odsql.startswith('(') and odsql.endswith(')')):
-      odsql = f'({odsql})'
-    q.raw = f'not {odsql}'
-    return q
+    return Q.from_node(Not.of(self.node))
 
   @property
   def odsql(self) -> Optional[ODSQL]:
     """
     ODSQL representation of query expressions
     """
-    if self.raw:
-      return self.raw
-
-    if not self.kwargs:
+    if self.node is None:
       return None
-
-    expressions = []
-    for key, value in self.kwargs.items():
-      field_name, lookup = Lookup.parse(key)
-      field_name = self._annotations.get(field_name, field_name)
-      field = lang.fld(field_name)
-
-      # Handle lookups
-      expression = None
-      if lookup == Lookup.CONTAINS:
-        op, query = 'like', lang.str(value)
-      elif lookup == Lookup.GT:
-        op, query = '>', value
-      elif lookup == Lookup.GTE:
-        op, query = '>=', value
-      elif lookup == Lookup.LT:
-        op, query = '<', value
-      elif lookup == Lookup.LTE:
-        op, query = '<=', value
-      elif lookup == Lookup.IN:
-        queries = (
-          lang.str(query)
-          if isinstance(query, str)
-          else query
-          for query in value
-        )
-        expression = ' or '.join(f'{field} = {query}' for query in queries)
-        expression = f'({expression})'
-      elif lookup == Lookup.INAREA:
-        expression = value.format(field)
-      elif lookup == Lookup.INRANGE:
-        op, query = 'in', value
-      elif lookup == Lookup.ISNULL:
-        op, query = 'is', f'{"" if value is True else "not "}null'
-      elif isinstance(value, bool):
-        op, query = 'is', str(value).lower()
-      else:
-        op, query = '=', lang.str(value) if isinstance(value, str) else value
-
-      expressions.append(expression or f'{field} {op} {query}')
-    return " and ".join(expressions)
+    if self._odsql is None:
+      self._odsql = self.node.render(self._annotations)
+    return self._odsql
 
   def annotate(self, annotations: dict) -> Q:
-    self._annotations = annotations
+    if annotations != self._annotations:
+      self._annotations = dict(annotations)
+      self._odsql = None
     return self
 
 
@@ -175,7 +388,8 @@ class Query(models.OpendatasoftCore):
     self,
     api_options: Dict[str, str],
     lang: str,
-    timezone: str
+    timezone: str,
+    schemas: schema.SchemaRegistry = None
   ) -> None:
     """
     :param api_options: Dictionary of options with which to init
@@ -184,10 +398,13 @@ class Query(models.OpendatasoftCore):
       `date_format` method)
     :timezone str: Default timezone applied to datetime fields in queries and
       responses
+    :param schemas: Cache of dataset fields and metadata, shared by all
+      queries of a catalog
     """
     super().__init__(**api_options)
 
     self.api_options = api_options
+    self.schemas = schemas
     self.format = {
       'lang': lang,
       'timezone': timezone
@@ -199,9 +416,15 @@ class Query(models.OpendatasoftCore):
     self._refine = []
     self._exclude = []
     self._annotations = {}
+    self._guard: Optional[plan.Guard] = None
 
   def _clone(self) -> Query:
-    return deepcopy(self)
+    # Share the api options (such as the session) between clones, so that
+    # concurrent queries reuse the same connection pool, and share the schema
+    # cache
+    shared = [*self.api_options.values(), self.api_options, self.schemas]
+    memo = {id(value): value for value in shared}
+    return deepcopy(self, memo)
 
   @property
   def decoded_url(self) -> str:
@@ -224,26 +447,31 @@ class Query(models.OpendatasoftCore):
 
   ## Fetch results ##
 
-  def _get(self, **kwargs: Any) -> dict:
+  def _get(self, deadline: transport.Deadline = None, **kwargs: Any) -> dict:
     """
     Get raw results.
+    :param deadline: If provided, the API call fails once it passes
     :param **kwargs: Custom querystring parameters
     """
-    return super().get(self.url(**kwargs))
+    return super().get(self.url(**kwargs), deadline=deadline)
 
   def get(
     self,
     as_json: bool = False,
+    deadline: Union[float, transport.Deadline] = None,
     **kwargs: Any
   ) -> Union[NamedTuple, List[NamedTuple]]:
     """
     Get results, from a single API call. a dataset or record.
     :param as_json: If True, result is a dictionary
+    :param deadline: Number of seconds after which the API call fails with
+      DeadlineExceeded
     :param **kwargs: Custom querystring parameters, such as `limit` or `offset`
     """
-    json = self._get(**kwargs)
+    json = self._get(deadline=transport.Deadline.of(deadline), **kwargs)
 
     if self.many:
+      self._observe(item[self.json_key] for item in json[self.json_key_plural])
       return [
         item[self.json_key]
         if as_json
@@ -252,81 +480,365 @@ class Query(models.OpendatasoftCore):
       ]
 
     item = json[self.json_key]
+    self._observe([item])
     return item if as_json else self.model(**item)
 
-  def count(self) -> int:
-    return self._get(limit=0)['total_count']
+  @property
+  def _observing(self) -> bool:
+    """Whether fetched results update the schema cache"""
+    return (
+      self.schemas is not None
+      and self.model is models.Dataset
+      and not self._select
+    )
+
+  def _observe(self, items: Iterable[dict]) -> None:
+    """
+    Update the schema cache with fetched datasets.
+    :param items: Json-formatted results
+    """
+    if not self._observing:
+      return
+    for item in items:
+      self.schemas.observe(item)
+
+  def count(self, deadline: Union[float, transport.Deadline] = None) -> int:
+    deadline = transport.Deadline.of(deadline)
+    return self._get(deadline=deadline, limit=0)['total_count']
 
   def exists(self) -> bool:
     return self.count() > 0
 
-  def iterator(
+  def _pages(
     self,
     batch_size: int = 100,
-    as_json: bool = False
-  ) -> Union[dict, NamedTuple]:
+    deadline: transport.Deadline = None
+  ) -> Iterator[List[dict]]:
     """
-    Get an iterator of results.
+    Get an iterator of pages of json-formatted results, one per API call.
     :param batch_size: Number of results to fetch per API call
-    :param as_json: If True, results are json-formatted
+    :param deadline: If provided, API calls fail once it passes
     """
     count = offset = 0
     while offset <= count:
-      results = self._get(limit=batch_size, offset=offset)
+      start = time.monotonic()
+      results = self._get(deadline=deadline, limit=batch_size, offset=offset)
       count = results['total_count']
-      items = results[self.json_key_plural]
+      items = [item[self.json_key] for item in results[self.json_key_plural]]
+      if not offset:
+        self._check_cost(results, len(items), time.monotonic() - start, batch_size)
       offset += len(items)
+      self._observe(items)
 
-      for item in items:
-        json = item[self.json_key]
-        yield json if as_json else self.model(**json)
+      yield items
 
-      if offset == count:
+      if offset == count or not items:
         break
 
-  def all(self, batch_size: int = 100) -> List[NamedTuple]:
+  def _until_deadline(self, pages: Iterator[Any], partial: bool) -> Iterator[Any]:
+    """
+    Get pages until the deadline passes.
+    :param partial: If True, stop without error when the deadline passes.
+      Otherwise, raise DeadlineExceeded
+    """
+    while True:
+      try:
+        page = next(pages)
+      except StopIteration:
+        return
+      except exceptions.DeadlineExceeded as ex:
+        if not partial:
+          raise
+        logger.warning(f'Returning partial results of {self.decoded_url}: {ex}')
+        return
+      yield page
+
+  def iterator(
+    self,
+    batch_size: int = 100,
+    as_json: bool = False,
+    deadline: Union[float, transport.Deadline] = None,
+    partial: bool = False,
+    workers: int = None
+  ) -> Union[dict, NamedTuple]:
+    """
+    Get an iterator of results.
+    :param batch_size: Number of results to fetch per API call
+    :param as_json: If True, results are json-formatted
+    :param deadline: Number of seconds (from the first result requested)
+      after which iteration stops
+    :param partial: If True, iteration stops without error when the deadline
+      passes. Otherwise, it raises DeadlineExceeded
+    :param workers: If provided, pages are decoded by this many worker
+      processes, while the next pages are fetched
+    """
+    deadline = transport.Deadline.of(deadline)
+    if workers:
+      decode = functools.partial(
+        pipeline.decode,
+        self.json_key,
+        self.json_key_plural,
+        None if as_json else self.model
+      )
+      pages = iter(pipeline.Pipeline(
+        self,
+        decode,
+        batch_size=batch_size,
+        workers=workers,
+        deadline=deadline
+      ))
+    else:
+      pages = (
+        items if as_json else [self.model(**json) for json in items]
+        for items in self._pages(batch_size=batch_size, deadline=deadline)
+      )
+    for items in self._until_deadline(pages, partial):
+      yield from items
+
+  def all(
+    self,
+    batch_size: int = 100,
+    deadline: Union[float, transport.Deadline] = None,
+    partial: bool = False,
+    workers: int = None
+  ) -> List[NamedTuple]:
     """
     Get all results.
     :param batch_size: Number of results to fetch per API call
+    :param deadline: Number of seconds after which to stop fetching results
+    :param partial: If True, return the results fetched so far when the
+      deadline passes. Otherwise, raise DeadlineExceeded
+    :param workers: If provided, pages are decoded by this many worker
+      processes, while the next pages are fetched
     """
-    return list(self.iterator(batch_size=batch_size))
+    return list(self.iterator(
+      batch_size=batch_size,
+      deadline=transport.Deadline.of(deadline),
+      partial=partial,
+      workers=workers
+    ))
 
   def dataframe(
     self,
     batch_size: int = 100,
+    sample: int = None,
+    seed: int = None,
+    deadline: Union[float, transport.Deadline] = None,
+    partial: bool = False,
+    workers: int = None,
     **kwargs: Any
   ) -> pd.DataFrame:
     """
     Get results as a Pandas DataFrame.
     :param batch_size: Number of results to fetch per API call
+    :param sample: If provided, get a random sample of this many results
+    :param seed: Random seed of the sample
+    :param deadline: Number of seconds after which to stop fetching results
+    :param partial: If True, return the results fetched so far when the
+      deadline passes. Otherwise, raise DeadlineExceeded
+    :param workers: If provided, pages are decoded and normalized by this many
+      worker processes, while the next pages are fetched
     :param **kwargs: Kwargs to pass to pandas.json_normalize()
     """
+    deadline = transport.Deadline.of(deadline)
     if not self.many:
-      return pd.json_normalize(self.get(as_json=True))
-
-    it = self.iterator(batch_size=batch_size, as_json=True)
+      return pd.json_normalize(self.get(as_json=True, deadline=deadline))
+
+    if sample is not None:
+      items = self.sample(sample, seed=seed, as_json=True)
+      return pd.json_normalize(items, **kwargs)
+
+    if workers:
+      normalize = functools.partial(
+        pipeline.normalize,
+        self.json_key,
+        self.json_key_plural,
+        kwargs
+      )
+      pages = pipeline.Pipeline(
+        self,
+        normalize,
+        batch_size=batch_size,
+        workers=workers,
+        deadline=deadline
+      )
+      frames = list(self._until_deadline(iter(pages), partial))
+      if not frames:
+        return pd.json_normalize([], **kwargs)
+      return pd.concat(frames, ignore_index=True)
+
+    it = self.iterator(
+      batch_size=batch_size,
+      as_json=True,
+      deadline=deadline,
+      partial=partial
+    )
     return pd.json_normalize(it, **kwargs)
 
+  def _sample(self, n: int, seed: int = None) -> Tuple[List[dict], int]:
+    """
+    Get a random sample of json-formatted results.
+    :param n: Sample size
+    :param seed: Random seed. Default: a random seed
+    :returns: (sample, total number of results)
+    """
+    query = self._clone()
+    query._order_by = lang.random(seed)
+
+    items = []
+    count = 0
+    while len(items) < n:
+      limit = min(MAX_LIMIT, n - len(items))
+      results = query._get(limit=limit, offset=len(items))
+      count = results['total_count']
+      page = [item[self.json_key] for item in results[self.json_key_plural]]
+      items.extend(page)
+      if not page or len(items) >= count:
+        break
+    return items, count
+
+  def sample(
+    self,
+    n: int,
+    seed: int = None,
+    as_json: bool = False
+  ) -> List[Union[dict, NamedTuple]]:
+    """
+    Get a random sample of results, in as few API calls as possible. Samples
+    with the same seed are identical, as long as the results don't change.
+    :param n: Sample size
+    :param seed: Random seed. Default: a random seed
+    :param as_json: If True, results are json-formatted
+    """
+    items, _ = self._sample(n, seed=seed)
+    return items if as_json else [self.model(**item) for item in items]
+
+  def explain(
+    self,
+    batch_size: int = 100,
+    concurrency: int = 1,
+    probe_size: int = 10
+  ) -> plan.Plan:
+    """
+    Estimate the cost of fetching every result, from two cheap API calls: a
+    count, and a probe page of results.
+    :param batch_size: Number of results to fetch per API call
+    :param concurrency: Number of concurrent API calls
+    :param probe_size: Number of results of the probe page
+    """
+    if not self.many:
+      probed = self._probe()
+      warnings = plan.warnings(self.url(), 1, 1, MAX_LIMIT)
+      return plan.estimate(1, 1, 1, probed.probe, warnings=warnings)
+
+    empty = self._probe(limit=0)
+    page = self._probe(limit=min(probe_size, MAX_LIMIT))
+    return plan.estimate(
+      empty.count,
+      batch_size,
+      concurrency,
+      page.probe,
+      empty.probe,
+      warnings=plan.warnings(
+        self.url(limit=batch_size, offset=0),
+        empty.count,
+        batch_size,
+        MAX_LIMIT
+      )
+    )
+
+  def _probe(self, **kwargs: Any) -> Probed:
+    """
+    Measure an API call, bypassing coalescing and hedging.
+    :param **kwargs: Custom querystring parameters
+    """
+    start = time.monotonic()
+    response = self.fetch(self.url(**kwargs))
+    seconds = time.monotonic() - start
+    body = response.json()
+    results = len(body[self.json_key_plural]) if self.many else 1
+    return Probed(
+      plan.Probe(results, len(response.content), seconds),
+      body.get('total_count', 1)
+    )
+
+  def _check_cost(
+    self,
+    results: dict,
+    size: int,
+    seconds: float,
+    batch_size: int,
+    concurrency: int = 1
+  ) -> None:
+    """
+    Check the cost of fetching every result against the query's guard, from
+    the first page of results.
+    :param results: Raw results of the first page
+    :param size: Number of results of the first page
+    :param seconds: Duration of the first page's API call
+    :param batch_size: Number of results to fetch per API call
+    :param concurrency: Number of concurrent API calls
+    """
+    if self._guard is None:
+      return
+    page = plan.Probe.of(results, size, seconds)
+    self._guard.check(plan.estimate(
+      results['total_count'],
+      batch_size,
+      concurrency,
+      page
+    ))
+
   def first(self) -> Union[NamedTuple, None]:
     items = self.get(limit=1)
     if len(items) == 0:
       return None
     return items[0]
 
-  def last(self) -> NamedTuple:
-    count = self.count()
+  def last(
+    self,
+    deadline: Union[float, transport.Deadline] = None
+  ) -> NamedTuple:
+    """
+    Get the last result.
+    :param deadline: Number of seconds after which the API calls fail with
+      DeadlineExceeded
+    """
+    deadline = transport.Deadline.of(deadline)
+    count = self.count(deadline=deadline)
     if count == 0:
       return None
-    return self.get(limit=1, offset=count - 1)[0]
+    return self.get(limit=1, offset=count - 1, deadline=deadline)[0]
 
-  def aggregate(self, *args, **kwargs) -> dict:
+  def aggregate(
+    self,
+    *args: str,
+    approx: bool = False,
+    sample_size: int = 1000,
+    seed: int = None,
+    confidence: float = 0.95,
+    **kwargs: str
+  ) -> dict:
     """
     Get a dictionary of aggregate values. Each argument specifies a value
     that will be included in the output, and can be defined with a label.
+    :param approx: If True, estimate values from a random sample of results.
+      Values are `sampling.Estimate`s, with error bounds
+    :param sample_size: Sample size of approximate values
+    :param seed: Random seed of the sample
+    :param confidence: Confidence level of the error bounds
     """
     if not args and not kwargs:
       return {}
 
+    if approx:
+      return self._approximate(
+        {**{arg: arg for arg in args}, **kwargs},
+        sample_size=sample_size,
+        seed=seed,
+        confidence=confidence
+      )
+
     query = self.select(*args, **kwargs)
     results = query._get()
 
@@ -335,37 +847,64 @@ class Query(models.OpendatasoftCore):
 
     return results[self.json_key_plural][0][self.json_key]['fields']
 
+  def _approximate(
+    self,
+    aggregations: Dict[str, str],
+    sample_size: int,
+    seed: Optional[int],
+    confidence: float
+  ) -> Dict[str, sampling.Estimate]:
+    """Estimate aggregate values from a random sample of results."""
+    fields = list(dict.fromkeys(
+      lang.fld(field)
+      for expression in aggregations.values()
+      for field in sampling.fields(expression)
+    ))
+    # Only fetch the fields that are aggregated
+    query = self.select(*fields) if fields else self
+    items, count = query._sample(sample_size if fields else 1, seed=seed)
+
+    if count == 0:
+      return {}
+
+    return sampling.estimate(aggregations, items, count, confidence=confidence)
+
   ## Chainable querying methods ##
 
-  def filter(self, *args: Union[Q, ODSQL], **kwargs: Any) -> Query:
+  @staticmethod
+  def _expression(*args: Union[Q, ODSQL], **kwargs: Any) -> Optional[Expression]:
     """
-    Return results that match the given filters.
+    Join filters into one expression.
     :param *args: Q expressions or raw ODSQL queries
     :param **kwargs: Field lookups
     """
-    expressions = []
-    for expression in [*args, Q(**kwargs)]:
-      if isinstance(expression, Q):
-        expression.annotate(self._annotations)
-        expressions.append(expression.odsql)
-      else:
-        expressions.append(expression)
+    return And.of(*(
+      expression.node if isinstance(expression, Q) else Raw(expression)
+      for expression in [*args, Q(**kwargs)]
+      if expression
+    ))
 
+  def _where_clause(self, node: Optional[Expression]) -> Query:
     clone = self._clone()
-    clone._where.append(' and '.join(filter(None, expressions)))
+    if node is not None:
+      clone._where.append(node.render(self._annotations, self.compact_membership))
     return clone
 
+  def filter(self, *args: Union[Q, ODSQL], **kwargs: Any) -> Query:
+    """
+    Return results that match the given filters.
+    :param *args: Q expressions or raw ODSQL queries
+    :param **kwargs: Field lookups
+    """
+    return self._where_clause(self._expression(*args, **kwargs))
+
   def exclude(self, *args: Union[Q, ODSQL], **kwargs: Any) -> Query:
     """
     Return results that do not match the given filters.
     :param *args: Q expressions or raw ODSQL queries
     :param **kwargs: Field lookups
     """
-    query = self.filter(*args, **kwargs)
-    filter_expression = query._where.pop()
-    if filter_expression:
-      query._where.append(f'not ({filter_expression})')
-    return query
+    return self._where_clause(Not.of(self._expression(*args, **kwargs)))
 
   def select(self, *args: Any, **kwargs: Any) -> Query:
     """
@@ -404,7 +943,7 @@ class Query(models.OpendatasoftCore):
     clone = self._clone()
 
     if '?' in args:
-      clone._order_by = f'random({random.randint(0, 1000)})'
+      clone._order_by = lang.random()
       return clone
 
     expressions = (
@@ -439,6 +978,24 @@ class Query(models.OpendatasoftCore):
       clone._exclude.extend(f'{key}:{item}' for item in value)
     return clone
 
+  def guard(
+    self,
+    max_requests: int = None,
+    max_bytes: int = None,
+    max_seconds: float = None
+  ) -> Query:
+    """
+    Refuse to fetch every result if it would cost more than allowed: after the
+    first page, iterating over results raises CostExceeded if the estimated
+    cost (as in `explain()`) exceeds a limit.
+    :param max_requests: Maximum number of API calls
+    :param max_bytes: Maximum number of bytes of responses
+    :param max_seconds: Maximum number of seconds
+    """
+    clone = self._clone()
+    clone._guard = plan.Guard(max_requests, max_bytes, max_seconds)
+    return clone
+
   ## Not implemented ##
 
   def export(self):
@@ -457,10 +1014,17 @@ class CatalogQuery(Query):
   self.dataset().
   """
 
-  def __init__(self, **kwargs) -> None:
+  def __init__(self, schema_max_age: float = None, **kwargs) -> None:
+    """
+    :param schema_max_age: Number of seconds after which cached dataset fields
+      and metadata are fetched again. Default: never expire
+    """
     super().__init__(**kwargs)
+    if self.schemas is None:
+      self.schemas = schema.SchemaRegistry(self, max_age=schema_max_age)
     self.datasets = DatasetsQuery(
       api_options=self.api_options,
+      schemas=self.schemas,
       **self.format
     )
 
@@ -468,6 +1032,7 @@ class CatalogQuery(Query):
     return DatasetQuery(
       dataset_id=dataset_id,
       api_options=self.api_options,
+      schemas=self.schemas,
       **self.format
     )
 
@@ -479,6 +1044,14 @@ class DatasetsQuery(Query):
   json_key = model.__name__.lower()
   json_key_plural = f'{json_key}s'
 
+  def index(self, batch_size: int = 100) -> index.CatalogIndex:
+    """
+    Build an in-memory index of the datasets, for full-text search and facet
+    filtering without API calls.
+    :param batch_size: Number of datasets to fetch per API call
+    """
+    return index.CatalogIndex(self).build(batch_size=batch_size)
+
 
 class DatasetQuery(Query):
   """Interface for the Dataset API"""
@@ -492,19 +1065,76 @@ class DatasetQuery(Query):
     self.records = RecordsQuery(
       dataset_id=dataset_id,
       api_options=self.api_options,
+      schemas=self.schemas,
       **self.format
     )
 
   @property
   def base_path(self):
     return f'datasets/{self.dataset_id}'
-    
+
+  def attachments(self) -> List[models.Attachment]:
+    """Get the dataset's attachments."""
+    url = self.build_url(self.base_path, 'attachments')
+    json = models.OpendatasoftCore.get(self, url)
+    return [
+      models.Attachment(
+        href=item.get('href') or self._link(item),
+        metas=item.get('metas') or {}
+      )
+      for item in json.get('attachments', [])
+    ]
+
+  @staticmethod
+  def _link(item: dict) -> str:
+    """URL of an attachment, from its `self` link"""
+    return next(
+      link['href']
+      for link in item.get('links', [])
+      if link.get('rel') == 'self'
+    )
+
+  def download_attachments(
+    self,
+    directory: str,
+    attachments: List[models.Attachment] = None,
+    max_workers: int = 4,
+    chunk_size: int = 2**20
+  ) -> List[download.Download]:
+    """
+    Download attachments to a directory, several at a time. Each file is
+    streamed to disk in chunks; interrupted downloads are resumed, and files
+    that haven't changed since they were last downloaded are skipped.
+    :param directory: Directory to download files to
+    :param attachments: Attachments to download. Default: all of the dataset's
+      attachments
+    :param max_workers: Maximum number of concurrent downloads
+    :param chunk_size: Number of bytes to read and write at a time
+    """
+    if attachments is None:
+      attachments = self.attachments()
+    downloader = download.Downloader(
+      self.session,
+      directory,
+      chunk_size=chunk_size,
+      limiter=self.limiter,
+      timeout=self.timeout
+    )
+    results = downloader.download_all(
+      [(attachment.href, attachment.filename) for attachment in attachments],
+      max_workers=max_workers
+    )
+    return [
+      download.Download(attachment, path, downloaded)
+      for attachment, (path, downloaded) in zip(attachments, results)
+    ]
 
   def record(self, record_id: str) -> RecordQuery:
     return RecordQuery(
       dataset_id=self.dataset_id,
       record_id=record_id,
       api_options=self.api_options,
+      schemas=self.schemas,
       **self.format
     )
 
@@ -523,6 +1153,247 @@ class RecordsQuery(Query):
   def base_path(self):
     return f'datasets/{self.dataset_id}/records'
 
+  def _dataset(self) -> models.Dataset:
+    """Get the records' dataset, from the schema cache if possible."""
+    if self.schemas is not None:
+      return self.schemas.get(self.dataset_id)
+    return DatasetQuery(
+      dataset_id=self.dataset_id,
+      api_options=self.api_options,
+      **self.format
+    ).get()
+
+  def local(self, batch_size: int = 100) -> local.LocalQuery:
+    """
+    Load results into memory, to run further queries locally, without API
+    calls.
+    :param batch_size: Number of results to fetch per API call
+    """
+    items = list(self.iterator(batch_size=batch_size, as_json=True))
+    return local.LocalQuery.from_records(items, fields=self._dataset().fields)
+
+  def _arrow_schema(self, items: List[dict]) -> columnar.pa.Schema:
+    """
+    Arrow schema of results, based on the dataset's fields. If fields are
+    selected, the schema is limited to the fields in `items`, and the types of
+    other selected expressions are inferred.
+    :param items: A page of json-formatted results
+    """
+    dataset = self._dataset()
+    if not self._select:
+      return columnar.schema(dataset.fields, timezone=self.format['timezone'])
+    return columnar.infer_schema(
+      items,
+      dataset.fields,
+      timezone=self.format['timezone']
+    )
+
+  def iter_batches(
+    self,
+    batch_size: int = 100,
+    rows_per_batch: int = None
+  ) -> Iterator[columnar.pa.RecordBatch]:
+    """
+    Get an iterator of results as Apache Arrow record batches (requires
+    `pyarrow`). Columns are the record fields, typed after the dataset's
+    fields.
+    :param batch_size: Number of results to fetch per API call
+    :param rows_per_batch: Number of rows per record batch. Default: one
+      record batch per API call
+    """
+    pages = self._pages(batch_size=batch_size)
+    schema = None
+    for items in columnar.rechunk(pages, rows_per_batch):
+      if schema is None:
+        schema = self._arrow_schema(items)
+      yield columnar.record_batch(items, schema)
+
+  def to_parquet(
+    self,
+    path: str,
+    batch_size: int = 100,
+    rows_per_batch: int = None,
+    **kwargs: Any
+  ) -> None:
+    """
+    Write results to a Parquet file, one record batch at a time (requires
+    `pyarrow`).
+    :param path: Output file path
+    :param batch_size: Number of results to fetch per API call
+    :param rows_per_batch: Number of rows per record batch
+    :param **kwargs: Kwargs to pass to pyarrow.parquet.ParquetWriter()
+    """
+    batches = self.iter_batches(batch_size, rows_per_batch=rows_per_batch)
+    columnar.write_parquet(batches, path, lambda: self._arrow_schema([]), **kwargs)
+
+  def to_csv(
+    self,
+    path: str,
+    batch_size: int = 100,
+    rows_per_batch: int = None,
+    **kwargs: Any
+  ) -> None:
+    """
+    Write results to a CSV file, one record batch at a time (requires
+    `pyarrow`). Geo point fields are flattened to `<field>.lon` and
+    `<field>.lat` columns.
+    :param path: Output file path
+    :param batch_size: Number of results to fetch per API call
+    :param rows_per_batch: Number of rows per record batch
+    :param **kwargs: Kwargs to pass to pyarrow.csv.WriteOptions()
+    """
+    batches = self.iter_batches(batch_size, rows_per_batch=rows_per_batch)
+    columnar.write_csv(batches, path, lambda: self._arrow_schema([]), **kwargs)
+
+  def tiled_iterator(
+    self,
+    field: str,
+    area: Union[dict, geo.BBox, None] = None,
+    mode: str = None,
+    max_tile_size: int = 10000,
+    max_depth: int = 8,
+    max_workers: int = 8,
+    batch_size: int = 100,
+    as_json: bool = False
+  ) -> Union[dict, NamedTuple]:
+    """
+    Get an iterator of results, fetched concurrently from geographical tiles.
+    Tiles are subdivided until each matches at most `max_tile_size` results,
+    and results that fall on tile borders are only returned once. Results are
+    not ordered.
+    :param field: A geo_point field, or geo_shape field if `mode` is given
+    :param area: A GeoJSON geometry or bounding box (min lon, min lat, max lon,
+      max lat) to split into tiles. Default: the envelope of `field`
+    :param mode: Set mode used to compare a geo_shape field with each tile
+    :param max_tile_size: Maximum number of results per tile
+    :param max_depth: Maximum number of times a tile can be subdivided
+    :param max_workers: Maximum number of concurrent API calls
+    :param batch_size: Number of results to fetch per API call
+    :param as_json: If True, results are json-formatted
+    """
+    query = self
+    if area is None:
+      area = self.aggregate(envelope=lang.envelope(field)).get('envelope')
+      if area is None:
+        return
+    if isinstance(area, (dict, str)):
+      box = geo.bbox(area)
+      if box is None:
+        raise ValueError(f'Area has no coordinates to split into tiles: {area}')
+      query = self._inarea(field, area, mode)
+    else:
+      box = geo.pad(tuple(area))
+
+    # Tiles stream their pages through a bounded queue, so that fetching stays
+    # at most a few pages ahead of the consumer
+    pages = queue.Queue(maxsize=max_workers)
+    stop = threading.Event()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+      tiles = deque(
+        query._tiles(field, box, mode, max_tile_size, max_depth, executor)
+      )
+      running = 0
+      seen = set()
+      while tiles or running:
+        # Keep at most max_workers tiles in flight
+        while tiles and running < max_workers:
+          executor.submit(
+            self._produce_tile,
+            tiles.popleft(),
+            pages,
+            stop,
+            batch_size
+          )
+          running += 1
+
+        page = pages.get()
+        if page is None:
+          running -= 1
+          continue
+        if isinstance(page, Exception):
+          raise page
+        for json in page:
+          if json['id'] in seen:
+            continue
+          seen.add(json['id'])
+          yield json if as_json else self.model(**json)
+    finally:
+      stop.set()
+      executor.shutdown(cancel_futures=True)
+
+  @staticmethod
+  def _produce_tile(
+    tile: RecordsQuery,
+    pages: queue.Queue,
+    stop: threading.Event,
+    batch_size: int
+  ) -> None:
+    """
+    Fetch a tile's pages of results into a queue, until stopped. The tile ends
+    with None, or with the exception that it failed with.
+    """
+    try:
+      for items in tile._pages(batch_size=batch_size):
+        if not transport.put(pages, items, stop):
+          return
+    except Exception as ex:
+      transport.put(pages, ex, stop)
+      return
+    transport.put(pages, None, stop)
+
+  def _inarea(
+    self,
+    field: str,
+    area: Union[dict, str],
+    mode: str = None
+  ) -> RecordsQuery:
+    """Limit results to a GeoJSON area."""
+    area = lang.geom(area)
+    expression = (
+      lang.polygon(area)
+      if mode is None
+      else lang.geometry(area, mode=mode)
+    )
+    return self.filter(**{f'{field}{Lookup.INAREA}': expression})
+
+  def _tiles(
+    self,
+    field: str,
+    box: geo.BBox,
+    mode: Optional[str],
+    max_tile_size: int,
+    max_depth: int,
+    executor: ThreadPoolExecutor
+  ) -> List[RecordsQuery]:
+    """
+    Adaptively split a bounding box into tile queries, one level at a time.
+    Empty tiles are dropped. Raise ValueError if a tile has more results than
+    can be paged through, before any are fetched.
+    """
+    tiles = []
+    level = [(box, 0)]
+    while level:
+      queries = [self._inarea(field, geo.polygon(b), mode) for b, _ in level]
+      counts = executor.map(lambda query: query.count(), queries)
+
+      next_level = []
+      for (b, depth), query, count in zip(level, queries, counts):
+        if count == 0:
+          continue
+        if count > max_tile_size and depth < max_depth:
+          next_level.extend((quadrant, depth + 1) for quadrant in geo.split(b))
+        elif count > plan.MAX_OFFSET:
+          raise ValueError(
+            f'A tile of {count} results exceeds the pagination limit of '
+            f'{plan.MAX_OFFSET}. Increase max_depth, or lower max_tile_size'
+          )
+        else:
+          tiles.append(query)
+      level = next_level
+    return tiles
+
 
 class RecordQuery(Query):
   many = False
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import math
+import statistics
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import language as lang
+
+
+class Estimate(NamedTuple):
+  """An approximate aggregate value"""
+
+  value: Any
+  # Half-width of the confidence interval, or None if it can't be estimated
+  error: Optional[float]
+
+  def __str__(self) -> str:
+    if self.error is None:
+      return f'~{self.value}'
+    return f'{self.value} ± {self.error}'
+
+
+def fields(expression: str) -> List[str]:
+  """Fields that an aggregation function is computed from"""
+  name, arguments = lang.parse_function(expression)
+  if name == 'count' and arguments in [[], ['*']]:
+    return []
+  return arguments[:1]
+
+
+def estimate(
+  aggregations: Dict[str, str],
+  items: List[dict],
+  total: int,
+  confidence: float = 0.95
+) -> Dict[str, Estimate]:
+  """
+  Estimate aggregate values from a simple random sample.
+  :param aggregations: Aggregation functions, by label
+  :param items: Json-formatted records in the sample
+  :param total: Number of records that the sample is drawn from
+  :param confidence: Confidence level of error bounds
+  """
+  z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+  estimator = Estimator(items, total, z)
+  return {
+    label: estimator.estimate(expression)
+    for label, expression in aggregations.items()
+  }
+
+
+class Estimator:
+  def __init__(self, items: List[dict], total: int, z: float) -> None:
+    """
+    :param items: Json-formatted records in the sample
+    :param total: Number of records that the sample is drawn from
+    :param z: Standard score of the confidence level
+    """
+    self.items = items
+    self.size = len(items)
+    self.total = total
+    self.z = z
+    self.exact = self.size >= total
+    # Finite population correction
+    self.fpc = (
+      math.sqrt((total - self.size) / (total - 1))
+      if total > 1 and not self.exact
+      else 0
+    )
+
+  def values(self, field: str) -> List[Any]:
+    """Non-null values of a field"""
+    return [
+      item['fields'][field]
+      for item in self.items
+      if item['fields'].get(field) is not None
+    ]
+
+  def margin(self, stdev: float, size: int) -> float:
+    if size == 0:
+      return math.inf
+    return self.z * stdev / math.sqrt(size) * self.fpc
+
+  def estimate(self, expression: str) -> Estimate:
+    name, arguments = lang.parse_function(expression)
+    if not self.items:
+      return Estimate(None, None)
+    method = getattr(self, f'_{name}', None)
+    if method is None:
+      raise ValueError(f"Can't approximate '{expression}'")
+    return method(*arguments)
+
+  def _avg(self, field: str) -> Estimate:
+    values = self.values(field)
+    if not values:
+      return Estimate(None, None)
+    stdev = statistics.stdev(values) if len(values) > 1 else 0
+    return Estimate(statistics.fmean(values), self.margin(stdev, len(values)))
+
+  def _sum(self, field: str) -> Estimate:
+    # Null values count as 0, so that the sum scales with the population
+    values = [item['fields'].get(field) or 0 for item in self.items]
+    stdev = statistics.stdev(values) if len(values) > 1 else 0
+    mean = statistics.fmean(values)
+    return Estimate(
+      self.total * mean,
+      self.total * self.margin(stdev, self.size)
+    )
+
+  def _count(self, field: str = '*') -> Estimate:
+    if field == '*':
+      return Estimate(self.total, 0)
+    p = len(self.values(field)) / self.size
+    stdev = math.sqrt(p * (1 - p))
+    return Estimate(
+      round(self.total * p),
+      self.total * self.margin(stdev, self.size)
+    )
+
+  def _min(self, field: str) -> Estimate:
+    values = self.values(field)
+    # Sample extremes can't bound population extremes
+    return Estimate(min(values) if values else None, 0 if self.exact else None)
+
+  def _max(self, field: str) -> Estimate:
+    values = self.values(field)
+    return Estimate(max(values) if values else None, 0 if self.exact else None)
+
+  def _median(self, field: str) -> Estimate:
+    return self._percentile(field, 50)
+
+  def _percentile(self, field: str, percentile: str) -> Estimate:
+    values = sorted(self.values(field))
+    if not values:
+      return Estimate(None, None)
+    p = float(percentile) / 100
+    size = len(values)
+    value = values[min(size - 1, max(0, math.ceil(p * size) - 1))]
+    if self.exact:
+      return Estimate(value, 0)
+
+    # Distribution-free confidence interval, from the ranks of order
+    # statistics
+    spread = self.z * math.sqrt(size * p * (1 - p))
+    low = values[max(0, math.floor(size * p - spread) - 1)]
+    high = values[min(size - 1, math.ceil(size * p + spread) - 1)]
+    return Estimate(value, max(value - low, high - value))
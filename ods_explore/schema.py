@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING, Union
+
+from . import models
+
+if TYPE_CHECKING:
+  from .query import CatalogQuery, DatasetsQuery
+
+logger = logging.getLogger(__name__)
+
+# Default metadata that changes when a dataset's data or schema is modified
+VERSION_METAS = ['modified', 'data_processed', 'metadata_processed']
+
+
+def version(dataset: Union[models.Dataset, dict]) -> Tuple:
+  """
+  Modification metadata of a dataset, used to detect changes.
+  :param dataset: A dataset, or json-formatted dataset. Selected metadata may
+    be at the top level of a json-formatted dataset
+  """
+  if isinstance(dataset, dict):
+    default = (dataset.get('metas') or {}).get('default') or dataset
+  else:
+    default = (dataset.metas or {}).get('default') or {}
+  return tuple(default.get(key) for key in VERSION_METAS)
+
+
+def dataset_of(item: Union[models.Dataset, dict]) -> models.Dataset:
+  """A dataset, from a json-formatted dataset with any attributes"""
+  if isinstance(item, models.Dataset):
+    return item
+  return models.Dataset(**{key: item.get(key) for key in models.Dataset._fields})
+
+
+class Entry(NamedTuple):
+  dataset: models.Dataset
+  version: Tuple
+  checked_at: float
+
+
+class SchemaRegistry:
+  """
+  Cache of dataset fields and metadata, by dataset id, shared by all queries
+  of a catalog. Cached datasets are replaced whenever they're fetched, for
+  example by `DatasetQuery.get()` or `warm()`. Once a cached dataset is older
+  than `max_age`, its modification metadata is checked, and it's only fetched
+  again if it has changed.
+  """
+
+  def __init__(self, catalog: CatalogQuery, max_age: float = None) -> None:
+    """
+    :param catalog: Catalog used to fetch missing datasets
+    :param max_age: Number of seconds after which a cached dataset is checked
+      for modifications. Default: never check
+    """
+    self.catalog = catalog
+    self.max_age = max_age
+    self._entries: Dict[str, Entry] = {}
+    self._lock = threading.Lock()
+
+  def __contains__(self, dataset_id: str) -> bool:
+    return dataset_id in self._entries
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def get(self, dataset_id: str) -> models.Dataset:
+    """
+    Get a dataset, from the cache if possible.
+    :param dataset_id: The dataset id
+    """
+    entry = self._entries.get(dataset_id)
+    if entry is not None:
+      if not self._expired(entry):
+        return entry.dataset
+      if self._remote_version(dataset_id) == entry.version:
+        with self._lock:
+          self._entries[dataset_id] = entry._replace(checked_at=time.monotonic())
+        return entry.dataset
+      logger.debug(f'Dataset {dataset_id} modified, fetching its schema')
+
+    # Fetched datasets are cached by the query
+    return self.catalog.dataset(dataset_id).get()
+
+  def _remote_version(self, dataset_id: str) -> Tuple:
+    """Modification metadata of a dataset, fetched without its fields"""
+    query = self.catalog.dataset(dataset_id).select(*VERSION_METAS)
+    return version(query.get(as_json=True))
+
+  def fields(self, dataset_id: str) -> List[dict]:
+    """Field names and metadata of a dataset"""
+    return self.get(dataset_id).fields
+
+  def metas(self, dataset_id: str) -> dict:
+    """Metadata of a dataset"""
+    return self.get(dataset_id).metas
+
+  def observe(self, dataset: Union[models.Dataset, dict]) -> None:
+    """
+    Cache a dataset, replacing its cached version.
+    :param dataset: A dataset, or json-formatted dataset, as fetched from the
+      catalog
+    """
+    dataset = dataset_of(dataset)
+    entry = Entry(dataset, version(dataset), time.monotonic())
+    with self._lock:
+      self._entries[dataset.dataset_id] = entry
+
+  def warm(
+    self,
+    query: Optional[DatasetsQuery] = None,
+    batch_size: int = 100
+  ) -> int:
+    """
+    Cache every dataset in a catalog listing, with as few API calls as
+    possible.
+    :param query: Datasets to cache. Default: all datasets in the catalog
+    :param batch_size: Number of datasets to fetch per API call
+    :returns: The number of datasets cached
+    """
+    # Fetched datasets are cached by the query
+    query = (query if query is not None else self.catalog.datasets)._clone()
+    query.schemas = self
+    count = 0
+    for _ in query.iterator(batch_size=batch_size, as_json=True):
+      count += 1
+    return count
+
+  def invalidate(self, dataset_id: str = None) -> None:
+    """
+    Remove a dataset from the cache.
+    :param dataset_id: The dataset id. Default: remove all datasets
+    """
+    with self._lock:
+      if dataset_id is None:
+        self._entries.clear()
+      else:
+        self._entries.pop(dataset_id, None)
+
+  def _expired(self, entry: Entry) -> bool:
+    return (
+      self.max_age is not None
+      and time.monotonic() - entry.checked_at > self.max_age
+    )
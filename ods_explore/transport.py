@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+from collections import deque
+import queue
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple, Union
+
+import requests
+
+from . import exceptions
+
+Timeout = Union[float, Tuple[Optional[float], Optional[float]], None]
+
+# Seconds between checks for cancellation while waiting on a full queue
+POLL_INTERVAL = 0.1
+
+
+def identity(session: requests.Session) -> Hashable:
+  """
+  Authentication identity of a session, so that requests made with different
+  credentials are never confused.
+  """
+  auth = session.auth
+  try:
+    hash(auth)
+  except TypeError:
+    auth = id(auth)
+  return auth, session.headers.get('Authorization')
+
+
+def put(items: queue.Queue, item: Any, stop: threading.Event) -> bool:
+  """
+  Put an item into a bounded queue, waiting while it's full, until stopped.
+  :returns: False if stopped before the item was put
+  """
+  while not stop.is_set():
+    try:
+      items.put(item, timeout=POLL_INTERVAL)
+      return True
+    except queue.Full:
+      pass
+  return False
+
+
+class Deadline:
+  """A time budget, shared by the API calls of an operation"""
+
+  def __init__(self, seconds: float) -> None:
+    """
+    :param seconds: Number of seconds until the deadline, from now
+    """
+    self.seconds = seconds
+    self.expires = time.monotonic() + seconds
+
+  @classmethod
+  def of(cls, deadline: Union[float, Deadline, None]) -> Optional[Deadline]:
+    """A deadline, from a number of seconds or an existing deadline"""
+    if deadline is None or isinstance(deadline, Deadline):
+      return deadline
+    return cls(deadline)
+
+  def remaining(self) -> float:
+    return max(0.0, self.expires - time.monotonic())
+
+  @property
+  def expired(self) -> bool:
+    return self.remaining() == 0
+
+  def error(self) -> exceptions.DeadlineExceeded:
+    return exceptions.DeadlineExceeded(
+      f'Deadline of {self.seconds} seconds exceeded'
+    )
+
+  def check(self) -> None:
+    """Raise DeadlineExceeded if the deadline has passed."""
+    if self.expired:
+      raise self.error()
+
+  def timeout(self, timeout: Timeout) -> Timeout:
+    """
+    Cap a requests timeout (in seconds, or as a (connect, read) tuple) to the
+    time remaining. Raise DeadlineExceeded if none remains, since requests
+    refuses timeouts of 0.
+    """
+    remaining = self.remaining()
+    if remaining == 0:
+      raise self.error()
+    if isinstance(timeout, tuple):
+      return tuple(
+        remaining if value is None else min(value, remaining)
+        for value in timeout
+      )
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+class Call:
+  """An in-flight call, and its outcome once it has finished"""
+
+  def __init__(self) -> None:
+    self.done = threading.Event()
+    self.result: Any = None
+    self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+  """
+  Coalesce concurrent calls that share a key: the first caller makes the call,
+  and callers that arrive while it's in flight wait for, and share, its result.
+  """
+
+  def __init__(self) -> None:
+    self._calls: Dict[Hashable, Call] = {}
+    self._lock = threading.Lock()
+    # Counters
+    self.calls = 0
+    self.coalesced = 0
+
+  def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+    """
+    Call a function, unless a call with the same key is already in flight.
+    :param key: Key identifying identical calls
+    :param fn: Function to call
+    :returns: The result of the function, or of the in-flight call
+    """
+    with self._lock:
+      call = self._calls.get(key)
+      leader = call is None
+      if leader:
+        call = self._calls[key] = Call()
+        self.calls += 1
+      else:
+        self.coalesced += 1
+
+    if not leader:
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result
+
+    try:
+      call.result = fn()
+    except BaseException as ex:
+      call.error = ex
+      raise
+    finally:
+      with self._lock:
+        del self._calls[key]
+      call.done.set()
+    return call.result
+
+
+class RateLimiter:
+  """Space out calls to a maximum rate, shared between threads"""
+
+  def __init__(self, rate: float) -> None:
+    """
+    :param rate: Maximum number of calls per second
+    """
+    self.interval = 1 / rate
+    self._next = 0.0
+    self._lock = threading.Lock()
+
+  def acquire(self) -> None:
+    """Wait until a call can be made."""
+    with self._lock:
+      now = time.monotonic()
+      wait = self._next - now
+      self._next = max(now, self._next) + self.interval
+    if wait > 0:
+      time.sleep(wait)
+
+
+class Hedger:
+  """
+  Hedge slow calls: if a call takes longer than a percentile of recent call
+  latencies, a duplicate call is made, and the first to succeed is used. Only
+  idempotent calls should be hedged.
+  """
+
+  def __init__(
+    self,
+    percentile: float = 95,
+    window: int = 100,
+    min_samples: int = 20,
+    budget: float = 0.05
+  ) -> None:
+    """
+    :param percentile: Percentile of recent latencies after which a call is
+      hedged
+    :param window: Number of recent latencies to keep
+    :param min_samples: Number of latencies needed before calls are hedged
+    :param budget: Maximum number of duplicate calls, as a fraction of calls
+    """
+    self.percentile = percentile
+    self.min_samples = min_samples
+    self.budget = budget
+    self._latencies: Deque[float] = deque(maxlen=window)
+    self._lock = threading.Lock()
+    # Counters
+    self.calls = 0
+    self.hedged = 0
+    self.wins = 0
+
+  def delay(self) -> Optional[float]:
+    """Number of seconds after which a call is hedged, if enough are known"""
+    with self._lock:
+      latencies = sorted(self._latencies)
+    if not latencies or len(latencies) < self.min_samples:
+      return None
+    return latencies[round(self.percentile / 100 * (len(latencies) - 1))]
+
+  def _observe(self, latency: float) -> None:
+    with self._lock:
+      self._latencies.append(latency)
+
+  def _spend(self) -> bool:
+    """Count a duplicate call, if the budget allows it."""
+    with self._lock:
+      if self.hedged >= self.budget * self.calls:
+        return False
+      self.hedged += 1
+      return True
+
+  def _start(self, fn: Callable[[], Any], finished: threading.Event) -> Call:
+    """Make a call in a background thread."""
+    call = Call()
+
+    def run() -> None:
+      start = time.monotonic()
+      try:
+        call.result = fn()
+        self._observe(time.monotonic() - start)
+      except BaseException as ex:
+        call.error = ex
+      finally:
+        call.done.set()
+        finished.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return call
+
+  def do(self, fn: Callable[[], Any]) -> Any:
+    """
+    Call a function, and call it again if it's slow.
+    :param fn: Function to call
+    :returns: The result of the first call to succeed
+    """
+    with self._lock:
+      self.calls += 1
+    delay = self.delay()
+    if delay is None:
+      start = time.monotonic()
+      result = fn()
+      self._observe(time.monotonic() - start)
+      return result
+
+    finished = threading.Event()
+    primary = self._start(fn, finished)
+    if primary.done.wait(delay) or not self._spend():
+      primary.done.wait()
+      if primary.error is not None:
+        raise primary.error
+      return primary.result
+
+    backup = self._start(fn, finished)
+    while True:
+      finished.wait()
+      finished.clear()
+      for call in [primary, backup]:
+        if call.done.is_set() and call.error is None:
+          if call is backup:
+            with self._lock:
+              self.wins += 1
+          return call.result
+      if primary.done.is_set() and backup.done.is_set():
+        raise primary.error
@@ -4,5 +4,11 @@ setup(
   name='ods-explore',
   version='1.0.0',
   packages=['ods_explore'],
-  install_requires=['pandas', 'requests']
+  install_requires=['pandas', 'requests'],
+  extras_require={
+    'arrow': ['pyarrow']
+  },
+  entry_points={
+    'console_scripts': ['ods-explore=ods_explore.cli:main']
+  }
 )